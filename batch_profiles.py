@@ -0,0 +1,171 @@
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import country_profile
+import instrument
+import llm
+import reference
+import render
+import transport
+
+#-----------------------------------------------------------------
+# Headless Country Profiles for every WHO/Europe country
+#
+#   python batch_profiles.py [--country ALB ...] [--workers 4] [--llm-workers 4] [--no-ai] [--out DIR]
+#
+# Same pipeline as the Country Profile page (country_profile.py), organized
+# for throughput: every indicator is fetched once and sliced per country,
+# all the charts of the run are rendered together in the render.py process
+# pool, the AI reports of several countries are asked concurrently and the
+# Word files are written in a process pool. Writes one <ISO3>.docx per
+# country and summary.json in data/profiles/<run>/ (or --out).
+#-----------------------------------------------------------------
+
+PROFILES_DIR = Path(__file__).parent/'data/profiles'
+
+
+def openai_key():
+    #same secret as the Streamlit app, unless OPENAI_API_KEY is set
+    import toml
+    secrets = Path(__file__).parent/'.streamlit/secrets.toml'
+    if os.environ.get('OPENAI_API_KEY') or not secrets.exists(): return os.environ.get('OPENAI_API_KEY')
+    return toml.load(secrets).get('OPENAI_API_KEY')
+
+
+def fetch_all(rows):
+    #every profile indicator once, for all the countries, split by country in one pass:
+    #[(row, gdp_df, {country code: rows of the country}, error)] in catalog order
+    fetched = []
+    for row, gdp_df, error in country_profile.fetch_profile_indicators(rows):
+        by_country = dict(tuple(gdp_df.groupby('Country Code', observed=True))) if error is None else {}
+        fetched.append((row, gdp_df, by_country, error))
+    return fetched
+
+
+def country_profile_parts(country, fetched):
+    #country: its row of the country file; returns the sections, doc sections and
+    #(AI prompt data, its token report) of the country, from its slice of the shared frames
+    iso3, iso2 = [country['Countries.code']], [country['Countries.iso2']]
+    sections, doc_sections, frames, tables = [], [], [], []
+    for i, (row, gdp_df, by_country, error) in enumerate(fetched):
+        code = iso2[0] if row['Indicator.datasource'] == "EUROSTAT" else iso3[0]
+        country_df = by_country.get(code, gdp_df.iloc[:0]) if error is None else None
+        section, doc_section, dtc, pivot_data = country_profile.profile_section(i, row, country_df, error, iso3, iso2)
+        sections.append(section)
+        doc_sections.append(doc_section)
+        if dtc is not None:
+            frames.append((section['title'], dtc))
+            tables.append((section['title'], pivot_data))
+    return sections, doc_sections, country_profile.profile_prompt(frames, tables)
+
+
+def write_docx(path, heading, doc_sections, pngs, analysis, report):
+    #runs in the docx process pool
+    path = Path(path)
+    path.write_bytes(country_profile.build_docx(heading, doc_sections, pngs, analysis, report))
+    return path.stat().st_size
+
+
+def safe_name(text):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', str(text))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Produce the Country Profile of every WHO/Europe country')
+    parser.add_argument('--country', action='append', help='ISO3 code, can be repeated (default: all)')
+    parser.add_argument('--workers', type=int, default=max(1, min(4, os.cpu_count() or 1)), help='processes writing the Word files')
+    parser.add_argument('--llm-workers', type=int, default=4, help='countries whose AI reports are asked concurrently')
+    parser.add_argument('--no-ai', action='store_true', help='skip the AI reports')
+    parser.add_argument('--out', help='output directory, default data/profiles/<time>')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    run = instrument.new_run('batch profiles')
+    out = Path(args.out) if args.out else PROFILES_DIR/datetime.now().strftime('%Y%m%dT%H%M%S')
+    out.mkdir(parents=True, exist_ok=True)
+
+    indicators_df = reference.indicators()
+    countries_df = reference.countries()
+    if args.country: countries_df = countries_df[countries_df['Countries.code'].isin(args.country)]
+    countries = [country for index, country in countries_df.iterrows()]
+
+    indi_df = country_profile.profile_indicators(indicators_df)
+    rows = [row for index, row in indi_df.iterrows()]
+    print("profiles:", len(countries), "countries,", len(rows), "indicators ->", out)
+
+    with instrument.stage('fetch all', indicators=len(rows)):
+        fetched = fetch_all(rows)
+    failed_fetch = sum(1 for row, gdp_df, by_country, error in fetched if error is not None)
+    print("  fetched %d indicators (%d failed) in %.1fs" % (len(fetched), failed_fetch, time.perf_counter() - started))
+
+    parts = {}
+    with instrument.stage('slice', countries=len(countries)):
+        for country in countries:
+            parts[country['Countries.code']] = country_profile_parts(country, fetched)
+
+    #every chart of the run in one go, through the render process pool (and its PNG cache)
+    specs = [doc_section['spec'] for sections, doc_sections, prompt_data in parts.values() for doc_section in doc_sections if doc_section['spec'] is not None]
+    pngs = iter(render.render_pngs(specs))
+    country_pngs = {code: [next(pngs) for doc_section in doc_sections if doc_section['spec'] is not None]
+                    for code, (sections, doc_sections, prompt_data) in parts.items()}
+    print("  rendered %d charts" % len(specs))
+
+    ai = {}
+    if not args.no_ai:
+        llm.configure(api_key=openai_key())
+        with ThreadPoolExecutor(max_workers=args.llm_workers) as executor:
+            futures = {country['Countries.code']: executor.submit(country_profile.ai_reports, country['Countries.short_name'], parts[country['Countries.code']][2][0])
+                       for country in countries}
+            for code, future in futures.items():
+                try:
+                    ai[code] = future.result()
+                except Exception as e:
+                    ai[code] = e
+        print("  AI reports done")
+
+    summary = []
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {}
+        for country in countries:
+            code = country['Countries.code']
+            sections, doc_sections, prompt_data = parts[code]
+            analysis, report = ai[code] if isinstance(ai.get(code), tuple) else ('', '')
+            heading = country_profile.profile_heading(country['Countries.short_name'], len(rows))
+            path = out/(safe_name(code) + '.docx')
+            futures[code] = (country, sections, path, pool.submit(write_docx, str(path), heading, doc_sections, country_pngs[code], analysis, report))
+
+        for code, (country, sections, path, future) in futures.items():
+            entry = {'code': code, 'country': country['Countries.short_name'],
+                     'indicators': len(sections), 'with_data': sum(1 for section in sections if section['status'] == 'ok'),
+                     'prompt': parts[code][2][1]}
+            if isinstance(ai.get(code), Exception): entry['ai_error'] = repr(ai[code])
+            try:
+                entry['docx'] = path.name
+                entry['bytes'] = future.result()
+                entry['status'] = 'ok'
+            except Exception as e:
+                entry['status'] = 'failed'
+                entry['error'] = repr(e)
+            summary.append(entry)
+            print("  %-6s %-30s %-6s %3d/%d indicators with data" % (code, entry['country'], entry['status'], entry['with_data'], entry['indicators']))
+
+    seconds = time.perf_counter() - started
+    report = {'created': datetime.now().isoformat(), 'seconds': round(seconds, 1), 'countries': len(countries),
+              'indicators': len(rows), 'failed_fetch': failed_fetch, 'ai': not args.no_ai,
+              'profiles': summary, 'stages': instrument.diagnostics_summary(run).reset_index().to_dict('records'),
+              'hosts': transport.host_metrics(), 'llm': llm.llm_metrics()}
+    (out/'summary.json').write_text(json.dumps(report, indent=1, default=str))
+
+    ok = sum(1 for entry in summary if entry['status'] == 'ok')
+    print("done in %.1fs: %d ok, %d failed (%.1fs per country) - %s" % (seconds, ok, len(summary) - ok, seconds / max(1, len(summary)), out/'summary.json'))
+
+
+if __name__ == '__main__':
+    main()
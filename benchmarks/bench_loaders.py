@@ -0,0 +1,131 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import hesr_store
+import loaders
+import reference
+import replay
+import transport
+
+#-----------------------------------------------------------------
+# Loader benchmarks against the recorded payloads (see replay.py)
+#
+#   python benchmarks/bench_loaders.py [--repeat 5] [--hesr s1_001 ...] [--out report.json]
+#
+# Times the fetch, decode, parse, normalize, filter and pivot stages of
+# every recorded indicator, served by the local stand-in, and the peak
+# Python memory of the whole pipeline. The report is written as JSON.
+#-----------------------------------------------------------------
+
+RESULTS_DIR = Path(__file__).parent/'results'
+
+
+def country_codes():
+    countries_df = reference.countries()
+    return countries_df['Countries.code'].dropna().tolist(), countries_df['Countries.iso2'].dropna().tolist()
+
+
+def filter_stage(gdp_df, codes):
+    #same selection as the Explore view: countries and the last 20 years
+    to_year = gdp_df['Year'].max()
+    return gdp_df[(gdp_df['Country Code'].isin(codes)) & (gdp_df['Year'] <= to_year) & (to_year - 20 <= gdp_df['Year'])]
+
+
+def pivot_stage(dtc):
+    dims = [dim for dim in dtc.columns if dim not in ('Year', 'Value')]
+    return pd.pivot_table(dtc, index=dims, columns="Year", values="Value", aggfunc='sum', observed=True)
+
+
+def pipelines(index, hesr_codes):
+    #yields (source, code, [(stage, function of the previous stage's output)])
+    for key, entry in index['http'].items():
+        url_a, url_b = loaders.indicator_urls(entry['source'], entry['code'])
+        parse = {"WORLD BANK": loaders.parse_wb_payload, "OECD": loaders.parse_oecd_payload}.get(entry['source'], loaders.parse_whoeurope_payload)
+        yield entry['source'], entry['code'], [
+            ('fetch', lambda x, url_a=url_a: transport.get(url_a).content),
+            ('decode', loaders.json_loads),
+            ('parse', lambda x, parse=parse: parse(x)[0])]
+
+    for code, entry in index['eurostat'].items():
+        yield entry['source'], code, [
+            ('fetch', lambda x, f=entry['file']: pd.read_parquet(replay.FIXTURES_DIR/'eurostat'/f)),
+            ('parse', lambda x: loaders.parse_eurostat_frame(x)[0])]
+
+    for code in hesr_codes:
+        yield "WHO/HESRI 2", code, [
+            ('fetch', lambda x, code=code: hesr_store.load_indicator(loaders.hesr_filename("WHO/HESRI 2"), code)),
+            ('parse', lambda x: loaders.parse_hesr_frame(x, "WHO/HESRI 2")[0])]
+
+
+def run_pipeline(source, stages, codes, repeat):
+    iso3, iso2 = codes
+    stages = stages + [('normalize', loaders.normalize_frame),
+                       ('filter', lambda x: filter_stage(x, iso2 if source == "EUROSTAT" else iso3)),
+                       ('pivot', pivot_stage)]
+    timings = {name: [] for name, fn in stages}
+    peak = 0
+    rows = 0
+
+    for i in range(repeat):
+        tracemalloc.start()
+        value = None
+        for name, fn in stages:
+            start = time.perf_counter()
+            value = fn(value)
+            timings[name].append(time.perf_counter() - start)
+            if name == 'parse': rows = len(value)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {'rows': rows, 'peak_mb': round(peak / 2**20, 2),
+            'stages': {name: {'min_ms': round(min(t) * 1000, 2), 'median_ms': round(statistics.median(t) * 1000, 2)} for name, t in timings.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the data loaders against recorded payloads')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--hesr', nargs='*', default=['s1_001'], help='HESR indicator codes (local store)')
+    parser.add_argument('--out', help='JSON report, default benchmarks/results/loaders-<time>.json')
+    args = parser.parse_args()
+
+    server, base_url = replay.start_server()
+    transport.set_base_url(base_url)
+
+    codes = country_codes()
+    results = []
+    for source, code, stages in pipelines(replay.read_index(), args.hesr):
+        try:
+            result = run_pipeline(source, stages, codes, args.repeat)
+        except Exception as e:
+            result = {'error': str(e)}
+        result.update({'source': source, 'code': code})
+        results.append(result)
+
+        if 'error' in result:
+            print("%-12s %-24s FAILED %s" % (source, code, result['error']))
+        else:
+            print("%-12s %-24s %8d rows %7.1f MB peak  " % (source, code, result['rows'], result['peak_mb']) +
+                  "  ".join("%s %.1f" % (name, t['median_ms']) for name, t in result['stages'].items()) + " (median ms)")
+
+    server.shutdown()
+
+    report = {'created': datetime.now(timezone.utc).isoformat(), 'python': platform.python_version(),
+              'pandas': pd.__version__, 'repeat': args.repeat, 'results': results}
+    out = Path(args.out) if args.out else RESULTS_DIR/('loaders-' + datetime.now().strftime('%Y%m%dT%H%M%S') + '.json')
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=1))
+    print("report:", out)
+
+
+if __name__ == '__main__':
+    main()
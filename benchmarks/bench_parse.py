@@ -0,0 +1,113 @@
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import loaders
+
+#-----------------------------------------------------------------
+# Per-row cost of the WHO/Europe and World Bank JSON parsing
+#
+#   python benchmarks/bench_parse.py --rows 20000 100000
+#
+# Synthetic payloads with the same shape as the APIs are decoded and parsed
+# with the previous row-by-row loops and with the columnar parsers of
+# loaders.py.
+#-----------------------------------------------------------------
+
+COUNTRIES = ['ALB', 'AND', 'ARM', 'AUT', 'AZE', 'BEL', 'BGR', 'BIH', 'BLR', 'CHE', 'CYP', 'CZE', 'DEU', 'DNK', 'ESP', 'EST', 'FIN', 'FRA', 'GBR', 'GEO']
+
+def make_wb_payload(rows):
+    records = [{'indicator': {'id': 'SH.XPD.CHEX.GD.ZS', 'value': 'Current health expenditure (% of GDP)'},
+                'country': {'id': 'XX', 'value': 'Country'},
+                'countryiso3code': COUNTRIES[i % len(COUNTRIES)],
+                'date': str(1960 + (i // len(COUNTRIES)) % 65),
+                'value': None if i % 7 == 0 else random.random() * 100,
+                'unit': '', 'obs_status': '', 'decimal': 1} for i in range(rows)]
+    return [{'page': 1, 'pages': 1, 'per_page': rows, 'total': rows}, records]
+
+def make_whoeurope_payload(rows):
+    data = [{'dimensions': {'COUNTRY': COUNTRIES[i % len(COUNTRIES)],
+                            'YEAR': str(1980 + (i // (2 * len(COUNTRIES))) % 45),
+                            'SEX': 'FEMALE' if i % 2 else 'MALE',
+                            'COUNTRY_GRP': ''},
+             'value': {'numeric': random.random() * 100}} for i in range(rows)]
+    return [{'code': 'HFA_1', 'dimensions': [{'code': 'COUNTRY'}, {'code': 'YEAR'}, {'code': 'SEX'}, {'code': 'COUNTRY_GRP'}], 'data': data}]
+
+#previous implementations, kept here as the baseline
+def legacy_wb(datalist):
+    years = []
+    gdp_values = []
+    country_codes = []
+
+    for entry in datalist[1]:
+        years.append(entry['date'])
+        gdp_values.append(entry['value'])
+        country_codes.append(entry['countryiso3code'])
+
+    gdp_df = pd.DataFrame({'Country Code': country_codes, 'Year': years, 'Value': gdp_values})
+    gdp_df['Year'] = pd.to_numeric(gdp_df['Year'])
+    return gdp_df
+
+def legacy_whoeurope(dt):
+    df_string = {}
+    years = []
+    values = []
+    country_codes = []
+    sex = []
+    dim = [i['code'] for i in dt[0]['dimensions']]
+    sex_split = ("SEX" in dim)
+
+    for entry in dt[0]['data']:
+        years.append(entry['dimensions']['YEAR'])
+        values.append(entry['value']['numeric'])
+        country_codes.append(entry['dimensions']['COUNTRY'])
+        df_string = {'Country Code': country_codes, 'Year': years, 'Value': values}
+
+        if (sex_split):
+            sex.append(entry['dimensions']['SEX'])
+            df_string.update ({'sex': sex})
+
+    df = pd.DataFrame(df_string)
+    df_cleaned = df[ df['Country Code'] != '']
+    gdp_df = df_cleaned.sort_values(by=['Country Code', 'Year'])
+    gdp_df['Year'] = pd.to_numeric(gdp_df['Year'])
+    return gdp_df
+
+def best_of(fn, arg, repeat):
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-row cost of the WHO/Europe and World Bank JSON parsing')
+    parser.add_argument('--rows', type=int, nargs='+', default=[20000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print("json decoder:", loaders.json_loads.__module__)
+    print("%-12s %8s %-22s %10s %10s" % ('payload', 'rows', 'stage', 'ms', 'us/row'))
+
+    for rows in args.rows:
+        for name, payload, legacy, columnar in [
+                ('worldbank', make_wb_payload(rows), legacy_wb, lambda p: loaders.parse_wb_payload(p)[0]),
+                ('whoeurope', make_whoeurope_payload(rows), legacy_whoeurope, lambda p: loaders.parse_whoeurope_payload(p)[0])]:
+            raw = json.dumps(payload).encode()
+
+            for stage, fn, arg in [('decode json', json.loads, raw),
+                                   ('decode ' + loaders.json_loads.__module__, loaders.json_loads, raw),
+                                   ('parse row loop', legacy, payload),
+                                   ('parse columnar', columnar, payload)]:
+                seconds = best_of(fn, arg, args.repeat)
+                print("%-12s %8d %-22s %10.1f %10.3f" % (name, rows, stage, seconds * 1000, seconds * 1e6 / rows))
+
+if __name__ == '__main__':
+    main()
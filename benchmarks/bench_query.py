@@ -0,0 +1,156 @@
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import hesr_store
+import loaders
+import query
+import replay
+
+#-----------------------------------------------------------------
+# Explore view filtering: boolean masks against the query index (query.py)
+#
+#   python benchmarks/bench_query.py [--queries 200] [--eurostat CODE ...] [--hesr CODE ...] [--out report.json]
+#
+# Runs the same random (countries, year range, dimension values, sex)
+# queries on the largest indicators at hand, once with the masks the
+# Explore view used (isin + year comparisons, one mask per dimension, two
+# OR masks for sex) and once with IndicatorIndex.select, checks that both
+# return the same rows and reports the time of each and of the index build.
+# Default indicators: the largest recorded Eurostat fixture (replay.py) and
+# the largest indicator of every HESR store; --eurostat downloads others.
+#-----------------------------------------------------------------
+
+RESULTS_DIR = Path(__file__).parent/'results'
+HESR_SOURCES = ["WHO/HESRI", "WHO/HESRI 2"]
+
+
+def largest_eurostat_fixture():
+    entries = replay.read_index()['eurostat']
+    files = [(code, replay.FIXTURES_DIR/'eurostat'/entry['file']) for code, entry in entries.items()]
+    files = [(code, path) for code, path in files if path.exists()]
+    if not files: return []
+    code, path = max(files, key=lambda f: f[1].stat().st_size)
+    gdp_df, meta = loaders.parse_eurostat_frame(pd.read_parquet(path))
+    return [("EUROSTAT", code, loaders.finish_indicator("EUROSTAT", code, gdp_df, meta))]
+
+
+def largest_hesr():
+    found = []
+    for source in HESR_SOURCES:
+        data_filename = loaders.hesr_filename(source)
+        if not data_filename.exists(): continue
+        manifest = hesr_store.open_store(data_filename)
+        store_dir = hesr_store.CACHE_DIR/data_filename.stem/manifest['version']
+        code = max(manifest['indicators'], key=lambda c: (store_dir/manifest['indicators'][c]).stat().st_size)
+        found.append((source, code))
+    return found
+
+
+def indicators(args):
+    #yields (source, code, (gdp_df, meta))
+    if args.eurostat is None: yield from largest_eurostat_fixture()
+    for code in args.eurostat or []:
+        yield "EUROSTAT", code, loaders.load_indicator("EUROSTAT", code)
+    for source, code in ([("WHO/HESRI 2", code) for code in args.hesr] if args.hesr else largest_hesr()):
+        yield source, code, loaders.load_indicator(source, code)
+
+
+def random_queries(gdp_df, meta, source, count, seed):
+    rng = random.Random(seed)
+    codes = sorted(gdp_df['Country Code'].astype(str).unique())
+    years = sorted(int(year) for year in gdp_df['Year'].unique())
+    filter_list = meta['filter_list']
+    if source[:9] == 'WHO/HESRI': filter_list = {key: values for key, values in filter_list.items() if key == 'dimension'}
+
+    for i in range(count):
+        countries = rng.sample(codes, min(len(codes), rng.randint(1, 15)))
+        from_year = rng.choice(years)
+        to_year = rng.choice([year for year in years if year >= from_year])
+        filters = {key: rng.choice(list(values)) for key, values in filter_list.items() if len(values)}
+        yield countries, from_year, to_year, filters
+
+
+def masks(gdp_df, countries, from_year, to_year, filters, split_sex):
+    #the filtering of the Explore view before query.py
+    data = gdp_df[(gdp_df['Country Code'].isin(countries)) & (gdp_df['Year'] <= to_year) & (from_year <= gdp_df['Year'])]
+    for key, value in filters.items():
+        data = data[data[key] == value]
+    if not split_sex: return {'all': data}
+    return {'F': data[(data['sex'] == 'F') | (data['sex'] == 'FEMALE')], 'M': data[(data['sex'] == 'M') | (data['sex'] == 'MALE')]}
+
+
+def same_rows(a, b):
+    return all(sorted(a[key].index) == sorted(b[key].index) for key in a)
+
+
+def ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def bench(source, code, gdp_df, meta, count, seed):
+    gdp_df = gdp_df.dropna()
+    split_sex = bool(meta['sex_split'])
+
+    start = time.perf_counter()
+    index = query.IndicatorIndex(gdp_df)
+    build = time.perf_counter() - start
+
+    timings = {'masks': [], 'index': []}
+    mismatches = 0
+    for countries, from_year, to_year, filters in random_queries(gdp_df, meta, source, count, seed):
+        start = time.perf_counter()
+        expected = masks(gdp_df, countries, from_year, to_year, filters, split_sex)
+        timings['masks'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        found = index.select(countries, from_year, to_year, filters, split_sex=split_sex)
+        timings['index'].append(time.perf_counter() - start)
+
+        if not same_rows(expected, found): mismatches += 1
+
+    return {'source': source, 'code': code, 'rows': len(gdp_df), 'sex_split': split_sex, 'queries': count,
+            'build_ms': ms(build), 'mismatches': mismatches,
+            'median_ms': {name: ms(statistics.median(t)) for name, t in timings.items()},
+            'p95_ms': {name: ms(sorted(t)[int(len(t) * 0.95) - 1]) for name, t in timings.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Explore view filtering: masks against the query index')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--eurostat', nargs='*', help='Eurostat codes to download instead of the largest fixture')
+    parser.add_argument('--hesr', nargs='*', help='WHO/HESRI 2 codes instead of the largest of each store')
+    parser.add_argument('--out', help='JSON report, default benchmarks/results/query-<time>.json')
+    args = parser.parse_args()
+
+    results = []
+    for source, code, (gdp_df, meta) in indicators(args):
+        result = bench(source, code, gdp_df, meta, args.queries, args.seed)
+        results.append(result)
+        print("%-12s %-24s %8d rows  build %8.1f ms  masks %7.2f ms  index %7.2f ms (median)  x%.1f%s" % (
+            source, code, result['rows'], result['build_ms'], result['median_ms']['masks'], result['median_ms']['index'],
+            result['median_ms']['masks'] / max(result['median_ms']['index'], 1e-3),
+            ('  %d MISMATCHES' % result['mismatches']) if result['mismatches'] else ''))
+
+    if not results: print("no indicator to benchmark: record Eurostat fixtures (replay.py) or pass --eurostat/--hesr")
+
+    report = {'created': datetime.now(timezone.utc).isoformat(), 'python': platform.python_version(),
+              'pandas': pd.__version__, 'queries': args.queries, 'seed': args.seed, 'results': results}
+    out = Path(args.out) if args.out else RESULTS_DIR/('query-' + datetime.now().strftime('%Y%m%dT%H%M%S') + '.json')
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=1))
+    print("report:", out)
+
+
+if __name__ == '__main__':
+    main()
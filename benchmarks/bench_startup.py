@@ -0,0 +1,123 @@
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import reference
+
+#-----------------------------------------------------------------
+# Startup benchmark of the Streamlit entry points
+#
+#   python benchmarks/bench_startup.py [--apps main.py chart.py] [--starts 3] [--reruns 10] [--clear-cache]
+#
+# Every cold start is a new Python process running the app once through
+# streamlit.testing.v1.AppTest: its wall time includes the interpreter,
+# the imports and the first script run, which is also timed alone. The
+# warm reruns follow in the same process, as a user changing a widget.
+# --clear-cache removes the Parquet copies of the reference tables before
+# every cold start (the first start after a workbook edit).
+#-----------------------------------------------------------------
+
+APP_DIR = Path(__file__).parent.parent
+RESULTS_DIR = Path(__file__).parent/'results'
+RUN_TIMEOUT = 120
+
+
+def child(app, reruns):
+    #runs in the measured process: prints one JSON line
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    imported = time.perf_counter() - start
+
+    at = AppTest.from_file(str(APP_DIR/app), default_timeout=RUN_TIMEOUT)
+    at.secrets['OPENAI_API_KEY'] = 'not-needed'
+    start = time.perf_counter()
+    at.run()
+    first = time.perf_counter() - start
+
+    times = []
+    for i in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - start)
+
+    print(json.dumps({'streamlit_import_s': imported, 'first_run_s': first, 'reruns_s': times,
+                      'exceptions': [str(e.value) for e in at.exception],
+                      'modules': sorted(name for name in ('openai', 'docx', 'vl_convert', 'xlrd', 'tiktoken') if name in sys.modules)}))
+
+
+def cold_start(app, reruns, clear_cache):
+    if clear_cache: shutil.rmtree(reference.CACHE_DIR, ignore_errors=True)
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, __file__, '--child', app, '--reruns', str(reruns)],
+                          cwd=APP_DIR, capture_output=True, text=True, timeout=RUN_TIMEOUT * (reruns + 2))
+    wall = time.perf_counter() - start
+    if proc.returncode != 0: raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'exit %d' % proc.returncode)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['wall_s'] = wall
+    return result
+
+
+def ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+def bench_app(app, starts, reruns, clear_cache):
+    runs = [cold_start(app, reruns if i == 0 else 0, clear_cache) for i in range(starts)]
+    warm = runs[0]['reruns_s']
+    return {'app': app,
+            'cold_wall_ms': {'min': ms(min(r['wall_s'] for r in runs)), 'median': ms(statistics.median(r['wall_s'] for r in runs))},
+            'first_run_ms': {'min': ms(min(r['first_run_s'] for r in runs)), 'median': ms(statistics.median(r['first_run_s'] for r in runs))},
+            'warm_rerun_ms': {'min': ms(min(warm)), 'median': ms(statistics.median(warm))} if warm else None,
+            'heavy_modules_loaded': runs[0]['modules'],
+            'exceptions': runs[0]['exceptions']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start and warm-rerun times of the Streamlit apps')
+    parser.add_argument('--apps', nargs='*', default=['main.py', 'chart.py'])
+    parser.add_argument('--starts', type=int, default=3, help='cold starts per app')
+    parser.add_argument('--reruns', type=int, default=10, help='warm reruns after the first cold start')
+    parser.add_argument('--clear-cache', action='store_true', help='remove the reference table cache before every cold start')
+    parser.add_argument('--out', help='JSON report, default benchmarks/results/startup-<time>.json')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.reruns)
+        return
+
+    results = []
+    for app in args.apps:
+        try:
+            result = bench_app(app, args.starts, args.reruns, args.clear_cache)
+        except Exception as e:
+            result = {'app': app, 'error': str(e)}
+        results.append(result)
+
+        if 'error' in result:
+            print("%-10s FAILED %s" % (app, result['error']))
+        else:
+            print("%-10s cold %8.1f ms  first run %8.1f ms  warm rerun %8.1f ms (median)  loaded: %s" % (
+                app, result['cold_wall_ms']['median'], result['first_run_ms']['median'],
+                result['warm_rerun_ms']['median'] if result['warm_rerun_ms'] else float('nan'),
+                ', '.join(result['heavy_modules_loaded']) or '-'))
+            for e in result['exceptions']: print("           exception:", e)
+
+    report = {'created': datetime.now(timezone.utc).isoformat(), 'python': platform.python_version(),
+              'starts': args.starts, 'reruns': args.reruns, 'clear_cache': args.clear_cache, 'results': results}
+    out = Path(args.out) if args.out else RESULTS_DIR/('startup-' + datetime.now().strftime('%Y%m%dT%H%M%S') + '.json')
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=1))
+    print("report:", out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import llm
+
+#-----------------------------------------------------------------
+# Local stand-in for the OpenAI chat completions API
+#
+#   python benchmarks/llm_standin.py serve [--port 8766] [--tokens 400] [--token-ms 5] [--first-token-ms 300]
+#   python benchmarks/llm_standin.py load [--calls 50] [--concurrency 8]
+#
+# serve answers POST /v1/chat/completions, streamed or not, with a
+# deterministic text of --tokens words at the given pace; point the app at
+# it with WELLBEING_LLM_BASE_URL=http://127.0.0.1:8766/v1. load starts one
+# in-process and sends concurrent uncached calls through llm.chat, then
+# prints the latency and time to first token percentiles.
+#-----------------------------------------------------------------
+
+
+def answer_words(messages, tokens):
+    #same request, same answer
+    seed = sum(len(m.get('content') or '') for m in messages)
+    return [('word%d' % ((seed + i) % 997)) for i in range(tokens)]
+
+
+def make_handler(tokens, token_ms, first_token_ms):
+    class StandinHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self.send_error(404, 'only chat completions')
+                return
+
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            messages = request.get('messages', [])
+            words = answer_words(messages, tokens)
+            usage = {'prompt_tokens': sum(len(m.get('content') or '') for m in messages) // 4,
+                     'completion_tokens': len(words), 'total_tokens': 0}
+            usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+            base = {'id': 'standin', 'created': int(time.time()), 'model': request.get('model', 'standin')}
+            time.sleep(first_token_ms / 1000)
+
+            if not request.get('stream'):
+                body = json.dumps(dict(base, object='chat.completion', usage=usage, choices=[
+                    {'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': ' '.join(words)}}])).encode()
+                time.sleep(token_ms * len(words) / 1000)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+
+            def send(payload):
+                data = ('data: ' + payload + '\n\n').encode()
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                self.wfile.flush()
+
+            for i, word in enumerate(words):
+                delta = {'content': (' ' if i else '') + word}
+                if i == 0: delta['role'] = 'assistant'
+                send(json.dumps(dict(base, object='chat.completion.chunk', choices=[{'index': 0, 'delta': delta, 'finish_reason': None}])))
+                time.sleep(token_ms / 1000)
+            send(json.dumps(dict(base, object='chat.completion.chunk', choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])))
+            if (request.get('stream_options') or {}).get('include_usage'):
+                send(json.dumps(dict(base, object='chat.completion.chunk', choices=[], usage=usage)))
+            send('[DONE]')
+            self.wfile.write(b'0\r\n\r\n')
+
+        def log_message(self, format, *args):
+            pass
+
+    return StandinHandler
+
+
+def start_server(port=0, tokens=400, token_ms=5, first_token_ms=300):
+    #serves from a daemon thread, returns (server, base_url)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(tokens, token_ms, first_token_ms))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:%d/v1' % server.server_address[1]
+
+
+def load(calls, concurrency, args):
+    server, base_url = start_server(0, args.tokens, args.token_ms, args.first_token_ms)
+    llm.configure(base_url=base_url)
+
+    def one(i):
+        return llm.chat([{'role': 'user', 'content': 'load test %d' % i}], 'load', use_cache=False)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(calls)))
+    seconds = time.perf_counter() - start
+    server.shutdown()
+
+    metrics = llm.call_metrics()
+    ms = sorted(m['ms'] for m in metrics)
+    first = sorted(m['first_token_ms'] for m in metrics if m['first_token_ms'] is not None)
+    print("%d calls, concurrency %d: %.1fs, %.1f calls/s" % (calls, concurrency, seconds, calls / seconds))
+    print("  latency ms         p50 %8.1f  p95 %8.1f  max %8.1f" % (statistics.median(ms), ms[int(len(ms) * 0.95) - 1], ms[-1]))
+    if first:
+        print("  first token ms     p50 %8.1f  p95 %8.1f  max %8.1f" % (statistics.median(first), first[int(len(first) * 0.95) - 1], first[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the OpenAI chat completions API')
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name in ['serve', 'load']:
+        cmd = sub.add_parser(name)
+        cmd.add_argument('--tokens', type=int, default=400, help='words per answer')
+        cmd.add_argument('--token-ms', type=float, default=5)
+        cmd.add_argument('--first-token-ms', type=float, default=300)
+        if name == 'serve':
+            cmd.add_argument('--port', type=int, default=8766)
+        else:
+            cmd.add_argument('--calls', type=int, default=50)
+            cmd.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        server, base_url = start_server(args.port, args.tokens, args.token_ms, args.first_token_ms)
+        print("stand-in on", base_url, "- set WELLBEING_LLM_BASE_URL=" + base_url)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        load(args.calls, args.concurrency, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import argparse
+import hashlib
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import loaders
+import reference
+import transport
+
+#-----------------------------------------------------------------
+# Record/replay of upstream payloads for the loader benchmarks
+#
+#   python benchmarks/replay.py record [--per-source 2] [--code WORLD\ BANK=SH.XPD.CHEX.GD.ZS]
+#   python benchmarks/replay.py serve [--port 8765]
+#
+# record fetches representative catalog indicators once and stores the raw
+# responses under benchmarks/fixtures/ (Eurostat: the wide frame returned
+# by the eurostat package, as Parquet). serve answers them from a local
+# HTTP stand-in; point the app at it with WELLBEING_HTTP_BASE.
+#-----------------------------------------------------------------
+
+FIXTURES_DIR = Path(__file__).parent/'fixtures'
+INDEX = 'index.json'
+HTTP_SOURCES = ["WORLD BANK", "WHO/Europe", "OECD"]
+
+
+def url_key(url):
+    #scheme-less key, the stand-in only sees host + path + query
+    parts = urlparse(url)
+    return parts.netloc + parts.path + ('?' + parts.query if parts.query else '')
+
+
+def read_index():
+    try:
+        with open(FIXTURES_DIR/INDEX) as f:
+            return json.load(f)
+    except OSError:
+        return {'http': {}, 'eurostat': {}}
+
+
+def write_index(index):
+    FIXTURES_DIR.mkdir(parents=True, exist_ok=True)
+    with open(FIXTURES_DIR/INDEX, 'w') as f:
+        json.dump(index, f, indent=1)
+
+
+def pick_indicators(per_source, codes):
+    indicators_df = reference.indicators()
+    pairs = indicators_df[['Indicator.datasource', 'Indicator_Code']].dropna().drop_duplicates()
+
+    picked = [tuple(code.split('=', 1)) for code in codes]
+    if per_source > 0:
+        for source, group in pairs.groupby('Indicator.datasource'):
+            picked += [(source, str(url_code)) for url_code in group['Indicator_Code'].head(per_source)]
+    return picked
+
+
+def record(per_source, codes):
+    import eurostat
+    index = read_index()
+
+    for source, url_code in pick_indicators(per_source, codes):
+        try:
+            if source in HTTP_SOURCES:
+                url_a, url_b = loaders.indicator_urls(source, url_code)
+                headers = None if source == "WORLD BANK" else loaders.HEADERS
+                response = transport.get(url_a, headers=headers)
+
+                file_name = hashlib.sha1(url_key(url_a).encode()).hexdigest()[:16] + '.body'
+                (FIXTURES_DIR/'http').mkdir(parents=True, exist_ok=True)
+                (FIXTURES_DIR/'http'/file_name).write_bytes(response.content)
+                index['http'][url_key(url_a)] = {'source': source, 'code': url_code, 'file': file_name,
+                                                 'content_type': response.headers.get('Content-Type', 'application/json')}
+                print("recorded", source, url_code, len(response.content), "bytes")
+
+            elif source == "EUROSTAT":
+                filter_pars = loaders.eurostat_filter_pars(url_code, geo=loaders.who_euro_iso2())
+                df = eurostat.get_data_df(url_code, filter_pars=filter_pars)
+                if df is None: continue
+
+                file_name = url_code + '.parquet'
+                (FIXTURES_DIR/'eurostat').mkdir(parents=True, exist_ok=True)
+                df.to_parquet(FIXTURES_DIR/'eurostat'/file_name, index=False)
+                index['eurostat'][url_code] = {'source': source, 'code': url_code, 'file': file_name}
+                print("recorded", source, url_code, len(df), "rows")
+        except Exception as e:
+            print("FAILED", source, url_code, e)
+
+    write_index(index)
+
+
+def make_handler(index):
+    class ReplayHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            entry = index['http'].get(self.path.lstrip('/'))
+            if entry is None:
+                self.send_error(404, 'not recorded')
+                return
+
+            body = (FIXTURES_DIR/'http'/entry['file']).read_bytes()
+            self.send_response(200)
+            self.send_header('Content-Type', entry['content_type'])
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ReplayHandler
+
+
+def start_server(port=0):
+    #serves the recorded payloads from a daemon thread, returns (server, base_url)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(read_index()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:%d' % server.server_address[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record upstream payloads and replay them from a local HTTP stand-in')
+    sub = parser.add_subparsers(dest='command', required=True)
+    rec = sub.add_parser('record')
+    rec.add_argument('--per-source', type=int, default=2, help='first N catalog indicators of each datasource')
+    rec.add_argument('--code', action='append', default=[], help='SOURCE=CODE, can be repeated')
+    srv = sub.add_parser('serve')
+    srv.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.per_source, args.code)
+    else:
+        server, base_url = start_server(args.port)
+        print("replaying", len(read_index()['http']), "payloads on", base_url, "- set WELLBEING_HTTP_BASE=" + base_url)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import threading
+from collections import namedtuple
+
+import reference
+
+#-----------------------------------------------------------------
+# Indicator catalog index
+#
+#   cat = catalog.get_catalog()
+#   cat.tree['WORLD BANK']          {area: (short name, ...)}, catalog order
+#   cat.records['GDP per capita']   {'source', 'area', 'code', 'short_name', 'long_name', 'profile'}
+#   cat.profile                     the Country Profile rows of the catalog
+#
+# Compiled once from data/Indicators.xlsx (reference.py) and shared by all
+# the sessions of the process, so the Explore selectors and the indicator
+# lookups are dictionary accesses instead of scans of the catalog frame.
+# It is compiled again when the workbook changes. Do not modify it.
+#-----------------------------------------------------------------
+
+Catalog = namedtuple('Catalog', ['tree', 'records', 'profile'])
+
+_compiled = []
+_lock = threading.Lock()
+
+
+def compile_catalog(indicators_df):
+    tree = {}
+    records = {}
+    for source, area, code, short_name, long_name, profile in indicators_df[
+            ['Indicator.datasource', 'Indicator.area', 'Indicator_Code', 'Indicator.short_name',
+             'Indicator.long_name', 'Country_Profile']].itertuples(index=False):
+        if isinstance(source, float) or isinstance(area, float) or isinstance(short_name, float): continue  #NaN: incomplete row
+
+        names = tree.setdefault(source, {}).setdefault(area, [])
+        if short_name not in names: names.append(short_name)
+        #the first row of a short name wins, as in the catalog lookups it replaces
+        records.setdefault(short_name, {'source': source, 'area': area, 'code': str(code), 'short_name': short_name,
+                                        'long_name': long_name, 'profile': profile == True})
+
+    tree = {source: {area: tuple(names) for area, names in areas.items()} for source, areas in tree.items()}
+    return Catalog(tree, records, indicators_df[indicators_df['Country_Profile'] == True])
+
+
+def get_catalog():
+    #the frame of reference.py is the same object until the workbook changes
+    table = reference.load_table(reference.INDICATORS)
+    with _lock:
+        if _compiled and _compiled[0] is table: return _compiled[1]
+    cat = compile_catalog(table)
+    with _lock:
+        _compiled[:] = [table, cat]
+    return cat
+
+
+def datasources(cat):
+    return tuple(cat.tree)
+
+
+def areas(cat, source):
+    return tuple(cat.tree.get(source, ()))
+
+
+def indicators(cat, source, area):
+    return cat.tree.get(source, {}).get(area, ())
@@ -1,11 +1,14 @@
 import streamlit as st
 import pandas as pd
-import math
-import json
-import requests
-from pathlib import Path
 import altair as alt
-import xlrd
+import catalog
+import country_index
+import loaders
+import query
+import snapshot
+import refresh
+import transport
+import instrument
 
 # Set the title and favicon that appear in the Browser's tab bar.
 st.set_page_config(
@@ -15,212 +18,32 @@ st.set_page_config(
 
 # Declare some useful functions.
 
-@st.cache_data
-def get_wb_data(url):
-    # Fetch data from the World Bank API in JSON format
-    response = requests.get(url)
-    datalist = response.json()    
-    
-    print ("url WB-->", url_a)
-    # Extract relevant data
-    years = []
-    gdp_values = []
-    country_codes = []
-    
-    for entry in datalist[1]:
-        years.append(entry['date'])
-        gdp_values.append(entry['value'])
-        country_codes.append(entry['countryiso3code'])
-
-    # Convert to DataFrame
-    gdp_df = pd.DataFrame({
-        'Country Code': country_codes,
-        'Year': years,
-        'Value': gdp_values
-    })
-        
-    MIN_YEAR = 1960
-    MAX_YEAR = 2024
-
-    # Convert years from string to integers
-    gdp_df['Year'] = pd.to_numeric(gdp_df['Year'])
-    
-    print (gdp_df.head())
-    return gdp_df
-
-def get_data_from_eurostat (url_code):
-    import eurostat
-    global filter_list, sex_split
-
-    #getting dimensions and data as pandas df
-    df = eurostat.get_data_df(url_code)
-    cols = list(df.columns)
-
-    #setting up filter string for unpivoting
-    not_unique_col = []
-    unpivot_string = []
-    vars_string = []
-    time_period = False
-
-    #defining vars to unpivot
-    for i in cols:
-            if (df[i].nunique() >1) or (): 
-                not_unique_col.append(i)
-
-    for i in not_unique_col:
-        if (time_period):
-            unpivot_string.append(i)
-        else:
-            vars_string.append(i)
-            if i[:3] == 'geo':
-                time_period = True
-                toberenamed = i 
-            else:
-                unique_values = df[i].unique()
-                
-                if i == 'sex':
-                    sex_split = True
-                else: 
-                    filter_list[i] = unique_values.tolist()
-    
-    #print ("id_vars", vars_string)
-    #print ("value_vars", unpivot_string)                
-    gdp_df = pd.melt (df, id_vars = vars_string, value_vars= unpivot_string, var_name='Year', value_name="Value")
-    gdp_df = gdp_df.rename (columns = {toberenamed : 'Country Code'})
-    gdp_df['Year'] = pd.to_numeric(gdp_df['Year'])
-    return gdp_df
-
-def get_data_from_whoeurope (url_code):
-    global filter_list, sex_split
-
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-    response = requests.get(url_code, headers=headers)
-
-    dt = response.json()
-    #print ("JSON Response status reading WHO api", response.status_code)
-
-    sex_split = False
-    df_string = {}
-    years = []
-    values = []
-    country_codes = []
-    sex = []
-    dim = []
-
-    for i in (dt[0]['dimensions']):
-        dim.append(i['code'])
-
-    if ("SEX" in dim): sex_split = True
-        
-    for entry in dt[0]['data']:
-        years.append(entry['dimensions']['YEAR'])
-        values.append(entry['value']['numeric'])
-        country_codes.append(entry['dimensions']['COUNTRY'])   
-        df_string = {'Country Code': country_codes, 'Year': years, 'Value': values}
-
-        if (sex_split): 
-            sex.append(entry['dimensions']['SEX'])
-            df_string.update ({'sex': sex})
-
-    # Convert to DataFrame
-    df = pd.DataFrame(df_string)
-
-    #check whether dataset has disaggregation by sex
-    if (sex_split):
-        if (df['sex'].nunique() < 2): sex_split = False
-
-    df_cleaned = df[ df['Country Code'] != '']
-    gdp_df = df_cleaned.sort_values(by=['Country Code', 'Year'])
-    gdp_df['Year'] = pd.to_numeric(gdp_df['Year'])
-    print (gdp_df.columns)
-    return gdp_df
-
-def get_data_from_OECD (url_code):
-    global filter_list, sex_split
-
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-    response = requests.get(url_code, headers=headers)
-    
-    print ("JSON Response status reading WHO api", response.status_code)
-
-    dt = response.json()   
-    
-    df_string = {}
-    years = []
-    values = []
-    country_codes = []
-    sex = []
-    dim = []
-
-    for i in (dt[0]['SeriesKey']):
-        dim.append(i['REF_AREA'])
-    
-    
-    for entry in dt[0]['data']:
-        years.append(entry['dimensions']['YEAR'])
-        values.append(entry['value']['numeric'])
-        country_codes.append(entry['dimensions']['COUNTRY'])   
-        df_string = {'Country Code': country_codes, 'Year': years, 'Value': values}
-
-        if (sex_split): 
-            sex.append(entry['dimensions']['SEX'])
-            df_string.update ({'sex': sex})
-
-    # Convert to DataFrame
-    df = pd.DataFrame(df_string)
-
-    if (sex_split):
-        if (df['sex'].nunique() < 2): sex_split = False
-
-    df_cleaned = df[ df['Country Code'] != '']
-    gdp_df = df_cleaned.sort_values(by=['Country Code', 'Year'])
-    gdp_df['Year'] = pd.to_numeric(gdp_df['Year'])
-    return gdp_df
-
-def get_data_from_WHOHESR (url_code):
-    global sex_split, filter_list
-    
-    not_unique_col = []
-    unpivot_string = []
-    vars_string = []
-    
-    if (source== "WHO/HESRI"): data_filename = Path(__file__).parent/'data/HESR1.xlsx'
-    else: data_filename = Path(__file__).parent/'data/HESR2.xlsx'
-    
-    hesr = pd.read_excel(data_filename)                     
-    df = pd.DataFrame(hesr)  
-    print ("len(df) before filtering",len(df))
-                    
-    df = df[df['indicator_abbr'] == url_code]
-    print ("len(df) after filtering",len(df))
-
-    cols = list(df.columns)
-    
-    for i in cols:
-        if (df[i].nunique()>1): not_unique_col.append(i)
-       
-    for i in not_unique_col:
-        vars_string.append(i)
-        unique_values = df[i].unique()
-                
-        if i == 'sex':
-            sex_split = True
-        else: 
-            filter_list[i] = unique_values.tolist()
-    
-    
-    #lighten the dataframe        
-    keys_to_remove = ['Country Code', 'Year', 'Value', 'population']  
-    if (source == 'WHO/HESRI 2'): keys_to_remove += ['Education', 'Income']
-    for key in keys_to_remove: 
-        if key in filter_list: del filter_list[key]
-    
-    #df = df.loc[df.groupby('Country Code')['Year'].idxmax()]
-    
-    df_cleaned = df.dropna()  
-    print("filter_list", filter_list)
-    print (df.head())    
-    return df_cleaned
+#data loaders are in loaders.py: each one returns the data and its dimensions,
+#so the result can be cached per (source, indicator) across reruns and sessions
+LOADER_CACHE_TTL = 6 * 3600
+QUERY_INDEX_ENTRIES = 32
+
+@st.cache_data(ttl=LOADER_CACHE_TTL, show_spinner=False)
+def load_indicator_cached (source, url_code, version):
+    #served from the local snapshot written by warmup.py; if missing there, from the
+    #local indicator cache, revalidated against the source when stale (refresh.py)
+    found = snapshot.load_indicator(source, url_code, version)
+    if found is not None: return found
+    return refresh.load_indicator(source, url_code)
+
+def get_indicator (source, url_code):
+    #the snapshot version is part of the cache key, a new snapshot is picked up at once
+    return load_indicator_cached(source, url_code, snapshot.current_version())
+
+@st.cache_resource(ttl=LOADER_CACHE_TTL, max_entries=QUERY_INDEX_ENTRIES, show_spinner=False)
+def indicator_index_cached (source, url_code, version):
+    #the Explore view queries the complete rows of the indicator through an index (query.py),
+    #built once and shared by the sessions: do not modify the index nor the meta
+    gdp_df, meta = load_indicator_cached(source, url_code, version)
+    return query.IndicatorIndex(gdp_df.dropna()), meta
+
+def get_indicator_index (source, url_code):
+    return indicator_index_cached(source, url_code, snapshot.current_version())
 
 def draw_chart (df, measure, container, sexdim):
     global sex_split
@@ -236,7 +59,7 @@ def draw_chart (df, measure, container, sexdim):
     if sex_split: headertext = measure + " - Sex = " + sexdim
     else:  headertext = measure
 
-    pivot_data = df.pivot_table(index="Country Code", columns="Year", values="Value").round(2)
+    pivot_data = df.pivot_table(index="Country Code", columns="Year", values="Value", observed=True).round(2)
     
     with container:
         st.header (headertext)
@@ -269,7 +92,7 @@ def draw_chart_hesr (df, measure, container, sexdim):
     if sex_split: headertext = measure + " - Sex = " + sexdim
     else:  headertext = measure
 
-    pivot_data = df.pivot_table(index="Country Code", columns="Year", values="Value").round(2)
+    pivot_data = df.pivot_table(index="Country Code", columns="Year", values="Value", observed=True).round(2)
     
     with container:
         st.header (headertext)
@@ -286,18 +109,16 @@ def draw_chart_hesr (df, measure, container, sexdim):
 st.header(":green[Well-being economy analysis tool]")
 st.write("_... to visualize well-being data from public databases_")
 
+#timings of every stage of this rerun, see the diagnostics panel at the bottom
+run = instrument.new_run("chart")
+
 # Populating variables on "indicators.xls" and "countries_WHO_Euro.csv" files
-data_filename = Path(__file__).parent/'data/Indicators.xlsx'
-indicators = pd.read_excel(data_filename)                 
-indicators_df = pd.DataFrame(indicators)                
+#compiled once per process, see catalog.py and country_index.py
+cat = catalog.get_catalog()
 sex_split = False
 filter_list = {}
 
-countries_WHOEURO = pd.read_excel(Path(__file__).parent/'data/countries_WHO_Euro.xls') 
-countries_df = pd.DataFrame(countries_WHOEURO)
-
-#Picking ISO3 as country code to match data
-countries_df['Country Code'] = countries_df['Countries.code']
+countries = country_index.get_country_index()
 
 mod = "Country Profile" 
 options = ["Explore countries", "Country Profile"]    
@@ -315,97 +136,63 @@ if ( mod == "Explore countries" ):
 
     # Initialize session state for category/indicator/country inputs
     if 'selected_datasource' not in st.session_state:
-        st.session_state.selected_datasource = indicators_df['Indicator.datasource'].unique()[0]
+        st.session_state.selected_datasource = catalog.datasources(cat)[0]
     if 'selected_cat' not in st.session_state:
-        st.session_state.selected_cat = indicators_df[indicators_df['Indicator.datasource'] == st.session_state.selected_datasource]['Indicator.area'].unique()[0]
+        st.session_state.selected_cat = catalog.areas(cat, st.session_state.selected_datasource)[0]
     if 'selected_ind' not in st.session_state:
-        st.session_state.selected_ind = indicators_df[(indicators_df['Indicator.datasource'] == st.session_state.selected_datasource) & 
-                                            (indicators_df['Indicator.area'] == st.session_state.selected_cat)]['Indicator.short_name'].unique()[0]
+        st.session_state.selected_ind = catalog.indicators(cat, st.session_state.selected_datasource, st.session_state.selected_cat)[0]
 
     # Function to update the options for Type based on selected Category
     def update_cat():
-        st.session_state.selected_cat = indicators_df[indicators_df['Indicator.datasource'] == st.session_state.selected_datasource]['Indicator.area'].unique()[0]
+        st.session_state.selected_cat = catalog.areas(cat, st.session_state.selected_datasource)[0]
         update_ind()
 
     # Function to update the options for Item based on selected Type
     def update_ind():
-        st.session_state.selected_ind= indicators_df[(indicators_df['Indicator.datasource'] == st.session_state.selected_datasource) & 
-                                            (indicators_df['Indicator.area'] == st.session_state.selected_cat)]['Indicator.short_name'].unique()[0]
+        st.session_state.selected_ind = catalog.indicators(cat, st.session_state.selected_datasource, st.session_state.selected_cat)[0]
        
     # Create widgets for each layer of input
     c1.pills(
         ''':green[**1/5 - Data from which datasource?**]''', 
-        options = indicators_df['Indicator.datasource'].unique(), 
+        options = catalog.datasources(cat), 
         key='selected_datasource',
         on_change=update_cat
     )
 
     c1.selectbox(
         ''':green[**2/5 Select a category**]''',
-        options=indicators_df[indicators_df['Indicator.datasource'] == st.session_state.selected_datasource]['Indicator.area'].unique(),
+        options=catalog.areas(cat, st.session_state.selected_datasource),
         key='selected_cat',
         on_change=update_ind
     )
 
     c1.selectbox(
         ''':green[**3/5 Select an indicator**]''',
-        options=indicators_df[(indicators_df['Indicator.datasource'] == st.session_state.selected_datasource) & 
-                (indicators_df['Indicator.area'] == st.session_state.selected_cat)]['Indicator.short_name'].unique(),
+        options=catalog.indicators(cat, st.session_state.selected_datasource, st.session_state.selected_cat),
         key='selected_ind'
     )
 
     source = st.session_state.selected_datasource
-    url_code = ''.join(indicators_df[indicators_df['Indicator.short_name'] == st.session_state.selected_ind]['Indicator_Code'].values[0])
-    measure = indicators_df[indicators_df['Indicator.short_name'] == st.session_state.selected_ind]['Indicator.short_name'].values[0]
-    ind_longtitle = indicators_df[indicators_df['Indicator.short_name'] == st.session_state.selected_ind]['Indicator.long_name'].values[0]
+    record = cat.records[st.session_state.selected_ind]
+    url_code = record['code']
+    measure = record['short_name']
+    ind_longtitle = record['long_name']
 
     #selecting data source
-    match source:
-        case "OECD":
-            url_a = "https://sdmx.oecd.org/public/rest/data/" + url_code
-            url_b = "https://data-explorer.oecd.org/vis?df[ds]=dsDisseminateFinalDMZ&df[id]=" + url_code +"&df[ag]=OECD.ELS.HD"  
-            gdp_df = get_data_from_OECD(url_a)
-                    
-        case "WORLD BANK":
-            url_a = "https://api.worldbank.org/v2/country/all/indicator/"+ url_code +"?format=json&per_page=20000"
-            url_b = "https://data.worldbank.org/indicator/" + url_code
-            gdp_df = get_wb_data(url_a)  
-            
-        case "EUROSTAT":
-            url_b = "https://ec.europa.eu/eurostat/web/products-datasets/-/"+ url_code
-            gdp_df = get_data_from_eurostat(url_code)
-            countries_df['Country Code'] = countries_df['Countries.iso2']
-        
-        case "WHO/Europe":
-            url_a = "https://dw.euro.who.int/api/v3/Batch/Measures?codes="+ url_code
-            url_b = "https://dw.euro.who.int/api/v3/Batch/Measures?codes="+ url_code
-            gdp_df = get_data_from_whoeurope(url_a)
-
-        case "WHO/HESRI":
-            url_a = "http://worldhealthorg.shinyapps.io/european_health_equity_dataset/"
-            url_b = "http://worldhealthorg.shinyapps.io/european_health_equity_dataset/"
-            gdp_df = get_data_from_WHOHESR (url_code)
-            
-        case "WHO/HESRI 2":
-            url_a = "http://worldhealthorg.shinyapps.io/european_health_equity_dataset/"
-            url_b = "http://worldhealthorg.shinyapps.io/european_health_equity_dataset/"
-            gdp_df = get_data_from_WHOHESR (url_code)
-        
-        case _:
-            c1.write ("No datasource selected")
+    if source not in loaders.SOURCES:
+        c1.write ("No datasource selected")
+        st.stop()
 
-    countries_df = countries_df.set_index('Country Code')
+    url_a, url_b = loaders.indicator_urls(source, url_code)
+    index, meta = get_indicator_index(source, url_code)
+    sex_split = meta['sex_split']
+    filter_list = meta['filter_list']
 
-    c = gdp_df['Country Code'].unique()   
-    cc = pd.DataFrame(c, columns=['Country Code'])              
+    #WHO/Europe countries with data for the indicator (ISO2 codes for Eurostat, ISO3 otherwise)
+    present = country_index.present(countries, list(index.countries), source)
 
-    #extract only Countries data from WHO/EURO
-    countries = pd.merge (cc, countries_df, on="Country Code" )                    
-
-    gdp_df = gdp_df.dropna()  
-    
-    min_value = gdp_df['Year'].min()
-    max_value = gdp_df['Year'].max()
+    min_value = int(index.years.min())
+    max_value = int(index.years.max())
 
     from_year, to_year = c1.slider(
         ''':green[**4/5 - Which years are you interested in?**]''',
@@ -413,7 +200,7 @@ if ( mod == "Explore countries" ):
         max_value=max_value,
         value=[min_value, max_value])
 
-    if not len(countries):
+    if not len(present):
         st.warning("Select at least one country")
 
     country_container = c1.container()  
@@ -422,26 +209,22 @@ if ( mod == "Explore countries" ):
     #Countried selection pane
     if sci_selected:
         selected_countries = country_container.multiselect (''':green[**5/5 - Which countries would you like to view?**]''',
-        countries['Countries.short_name'], countries.loc[countries['group']=='SCI', 'Countries.short_name'] )         
+        present, country_index.in_group(countries, present, 'SCI') )         
     else:
         selected_countries = country_container.multiselect (''':green[**5/5 - Which countries would you like to view?**]''',
-        countries['Countries.short_name'])
+        present)
 
-    filtered_countries = countries[countries['Countries.short_name'].isin(selected_countries)]
-    column_titles = filtered_countries.columns.tolist()
-    iso_acronyms = filtered_countries['Country Code'].tolist()
+    iso_acronyms = country_index.codes(countries, selected_countries, source)
     filter_criteria = {}
 
     c2  = col2.container(border=True)
 
     #panel for optional filters - if any - in the data source
     if len(filter_list) > 0:
-        print("len filter list", len(filter_list))
-        
         c2.subheader ("Filter dimensions...")    
         if sex_split: c2.write(":green[**- Sex disaggregation**]")
         
-        print (filter_list)
+        instrument.log('filter list', filter_list=filter_list)
         #Filtering data with indicator-specific dimensions
         for key, values in filter_list.items():
             filter_criteria[key] = c2.selectbox(f':green[**Select a value for {key}**]', values)
@@ -450,39 +233,30 @@ if ( mod == "Explore countries" ):
         c2.subheader ("Filter dimensions...")    
         c2.write(":green[**- Sex disaggregation**]")
 
-    # Filter the data
-    filtered_gdp_df = gdp_df[
-            (gdp_df['Country Code'].isin(iso_acronyms)) & (gdp_df['Year'] <= to_year) & (from_year <= gdp_df['Year'])
-        ]
+    # Filter the data: countries, years, dimension values and sex in one query (query.py)
+    parts = index.select(iso_acronyms, from_year, to_year, filter_criteria, split_sex=sex_split)
 
     #aligning boxes
     col1, col2 = st.columns(2)
     c1 = col1.container(border=True)
     c2 = col2.container(border=True)
 
-    if len(filtered_gdp_df)>0:
-        data_to_chart = filtered_gdp_df
-        
-        #filtering based on previous selections
-        for key, value in filter_criteria.items():
-            # filter with dimensions criteria
-            data_to_chart = data_to_chart[data_to_chart[key] == value]
-
+    if sum(len(part) for part in parts.values()) > 0:
 #########################           
         if sex_split:
             #prep the chart for sex=F
-            dtc = data_to_chart[(data_to_chart['sex'] == 'F') | (data_to_chart['sex'] == 'FEMALE')]
+            dtc = parts['F']
             if (source=='WHO/HESRI 2'): draw_chart_hesr(dtc, measure, c1, 'F')
             else: draw_chart(dtc, measure, c1, 'F')
         
             #prep the chart for sex=M
-            dtc = data_to_chart[(data_to_chart['sex'] == 'M')  | (data_to_chart['sex'] == 'MALE')]
+            dtc = parts['M']
             if (source=='WHO/HESRI 2'): draw_chart_hesr(dtc, measure, c2, 'M')
             else: draw_chart(dtc, measure, c2, 'M')
 
         else:           
             #drawing the chart when sex is not a dimension
-            draw_chart (data_to_chart, measure, c1, "")
+            draw_chart (parts['all'], measure, c1, "")
                                 
 ####################################                
     else:
@@ -500,11 +274,11 @@ elif (mod == "Country Profile"):
    
     #country selection
     selected_country= c1.selectbox(
-     ''':green[*For which country would you like to produce a report?**]''', countries_df['Countries.short_name'], index=None)
+     ''':green[*For which country would you like to produce a report?**]''', countries.names, index=None)
 
-    filtered_countries = countries_df[countries_df['Countries.short_name'] == selected_country]       
-    iso_acronyms = filtered_countries['Country Code'].to_list()
-    indi_df = indicators_df[indicators_df['Country_Profile'] == True]
+    #the fetch stage of the Country Profile is shared with main.py and batch_profiles.py
+    import country_profile
+    indi_df = cat.profile
     
     #By clicking the button we start the production of the Country profile
     if ((c1.button ("Produce Country profile")) & (selected_country != None)):
@@ -512,47 +286,25 @@ elif (mod == "Country Profile"):
         a = "Indicators to be elaborated: " + str(len(indi_df)) + " - Country: " + selected_country 
         c1.subheader (a)
         
-        #iterate all the indicators to be included in the report
-        for index, row in indi_df.iterrows():
-            iso_acronyms = filtered_countries['Country Code'].to_list()
+        #iterate all the indicators to be included in the report, fetched concurrently
+        #and drawn in catalog order as soon as each one has arrived
+        rows = [row for index, row in indi_df.iterrows()]
+        for row, gdp_df, error in country_profile.fetch_profile_indicators(rows):
             url_code = row['Indicator_Code']
             
             #title of the indicator            
             c1.subheader (str(row['Indicator.datasource'])+ " - " +(str(row['Indicator.short_name'])))
             
             source = row['Indicator.datasource']            
-            #getting data
-            match source:
-                case "OECD":
-                    url_a = "https://sdmx.oecd.org/public/rest/data/" + url_code
-                    url_b = "https://data-explorer.oecd.org/vis?df[ds]=dsDisseminateFinalDMZ&df[id]=" + url_code +"&df[ag]=OECD.ELS.HD"  
-                    gdp_df = get_data_from_OECD(url_a)
-                            
-                case "WORLD BANK":
-                    url_a = "https://api.worldbank.org/v2/country/all/indicator/"+ url_code +"?format=json&per_page=20000"
-                    url_b = "https://data.worldbank.org/indicator/" + url_code
-                    gdp_df = get_wb_data(url_a)  
-                    
-                case "EUROSTAT":
-                    url_b = "https://ec.europa.eu/eurostat/web/products-datasets/-/"+ url_code
-                    gdp_df = get_data_from_eurostat(url_code)
-                    iso_acronyms = filtered_countries['Countries.iso2'].to_list()
-                    url_a = url_b
-                                  
-                case "WHO/Europe":
-                    url_a = "https://dw.euro.who.int/api/v3/Batch/Measures?codes="+ url_code
-                    url_b = "https://dw.euro.who.int/api/v3/Batch/Measures?codes="+ url_code
-                    gdp_df = get_data_from_whoeurope(url_a)
-                
-                case "WHO/HESRI":
-                    url_a = "http://worldhealthorg.shinyapps.io/european_health_equity_dataset/"
-                    url_b = "http://worldhealthorg.shinyapps.io/european_health_equity_dataset/"
-                    gdp_df = get_data_from_WHOHESR (url_code)
-            
-                case "WHO/HESRI 2":
-                    url_a = "http://worldhealthorg.shinyapps.io/european_health_equity_dataset/"
-                    url_b = "http://worldhealthorg.shinyapps.io/european_health_equity_dataset/"
-                    gdp_df = get_data_from_WHOHESR (url_code)
+            url_a, url_b = loaders.indicator_urls(source, url_code)
+            if error is not None:
+                instrument.log('fetch failed', code=url_code, error=repr(error))
+                c1.write(":red[Data not available for this indicator]")
+                c1.html("<a href=" + url_a + " target='_blank'>Data link...</a>")
+                c1.write ('*************************************************************')
+                continue
+
+            iso_acronyms = country_index.codes(countries, [selected_country], source)
             
             #filtering data by country selection
             dtc = gdp_df[(gdp_df['Country Code'].isin(iso_acronyms))]
@@ -572,8 +324,6 @@ elif (mod == "Country Profile"):
             if (len(dtc) > 0):
                 dtc = dtc.dropna()         
                 column_titles = dtc.columns.tolist()
-                dims_lower = [dim.lower() for dim in column_titles]
-                print (url_code, column_titles, dims_lower)
                 dims2 = [dim for dim in column_titles if ((dim != 'Year') and (dim != 'Value'))]
             
                 #dims2 needed to draw dimensions lines in the chart
@@ -591,7 +341,7 @@ elif (mod == "Country Profile"):
                 c1.altair_chart(chart, use_container_width=True)
             
                 #pivoting data to show table below the chart
-                pivot_data = pd.pivot_table(dtc, index= dims2, columns="Year", values="Value", aggfunc='sum').round(2)   
+                pivot_data = pd.pivot_table(dtc, index= dims2, columns="Year", values="Value", aggfunc='sum', observed=True).round(2)   
                 c1.write (pivot_data)
                 
             else: c1.write(":red[Data not available for this indicator]")
@@ -602,6 +352,13 @@ elif (mod == "Country Profile"):
 else:
     st.write ("Select to proceed...")              
 
+#optional diagnostics panel, open the app with ?diagnostics=1
+if st.query_params.get('diagnostics') == '1':
+    with st.expander("Diagnostics - where this run spent its time", expanded=True):
+        st.dataframe(instrument.diagnostics_summary(run))
+        st.dataframe(instrument.diagnostics_frame(run))
+        st.dataframe(pd.DataFrame(transport.host_metrics()).T)
+
 #*********************************************************
             
     
\ No newline at end of file
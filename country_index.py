@@ -0,0 +1,84 @@
+import threading
+from collections import namedtuple
+
+import pandas as pd
+
+import reference
+
+#-----------------------------------------------------------------
+# WHO/Europe country index
+#
+#   countries = country_index.get_country_index()
+#   countries.names                       short names, in the order of the country file
+#   countries.by_iso3['ITA'], by_iso2['IT'], by_name['Italy']   -> position
+#   countries.by_group['SCI']             short names of the group
+#   country_index.present(countries, gdp_df['Country Code'], source)
+#   country_index.codes(countries, names, source)
+#
+# Compiled once from data/countries_WHO_Euro.xls (reference.py) and shared
+# by all the sessions of the process. The data of Eurostat is keyed by ISO2
+# codes, all the other sources by ISO3: source_key() picks the column, so
+# the country table is never modified. Do not modify the index either.
+#-----------------------------------------------------------------
+
+CountryIndex = namedtuple('CountryIndex', ['iso3', 'iso2', 'names', 'groups', 'by_iso3', 'by_iso2', 'by_name', 'by_group', 'keys'])
+
+_compiled = []
+_lock = threading.Lock()
+
+
+def _column(countries_df, col):
+    #strings, None where the file has no value
+    if col not in countries_df.columns: return (None,) * len(countries_df)
+    return tuple(str(value) if pd.notna(value) else None for value in countries_df[col])
+
+
+def compile_index(countries_df):
+    iso3 = _column(countries_df, 'Countries.code')
+    iso2 = _column(countries_df, 'Countries.iso2')
+    names = _column(countries_df, 'Countries.short_name')
+    groups = _column(countries_df, 'group')
+
+    by_group = {}
+    for name, group in zip(names, groups):
+        if group is not None: by_group.setdefault(group, []).append(name)
+
+    return CountryIndex(iso3, iso2, names, groups,
+                        by_iso3={code: i for i, code in enumerate(iso3) if code is not None},
+                        by_iso2={code: i for i, code in enumerate(iso2) if code is not None},
+                        by_name={name: i for i, name in enumerate(names) if name is not None},
+                        by_group={group: tuple(members) for group, members in by_group.items()},
+                        keys={'iso3': pd.Index(iso3), 'iso2': pd.Index(iso2)})
+
+
+def get_country_index():
+    #the frame of reference.py is the same object until the file changes
+    table = reference.load_table(reference.COUNTRIES)
+    with _lock:
+        if _compiled and _compiled[0] is table: return _compiled[1]
+    countries = compile_index(table)
+    with _lock:
+        _compiled[:] = [table, countries]
+    return countries
+
+
+def source_key(source):
+    return 'iso2' if source == "EUROSTAT" else 'iso3'
+
+
+def codes(countries, names, source=None):
+    #the codes of the data of the source for the given short names
+    column = countries.iso2 if source_key(source) == 'iso2' else countries.iso3
+    return [column[countries.by_name[name]] for name in names if name in countries.by_name]
+
+
+def present(countries, country_codes, source=None):
+    #short names of the WHO/Europe countries found in country_codes (e.g. the
+    #'Country Code' column of an indicator), in the order of the country file
+    found = countries.keys[source_key(source)].isin(pd.Series(country_codes).unique())
+    return tuple(name for name, hit in zip(countries.names, found) if hit and name is not None)
+
+
+def in_group(countries, names, group):
+    members = set(countries.by_group.get(group, ()))
+    return [name for name in names if name in members]
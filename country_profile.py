@@ -0,0 +1,398 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+import altair as alt
+import pandas as pd
+
+import instrument
+import jobs
+import llm
+import loaders
+import prompt
+import refresh
+import render
+import snapshot
+import summary
+import transport
+
+#-----------------------------------------------------------------
+# Country Profile pipeline, independent of the Streamlit page
+#
+# build_profile() fetches the profile indicators, filters them to the
+# country, renders the charts, asks the two AI reports and writes the Word
+# file. It reports through progress(stage, done, total, message) and hands
+# every output to save(name, value) as soon as it exists, so jobs.py can
+# run it in the background and the page can show a profile while it is
+# being built. The page draws the saved sections with profile_chart() and
+# profile_table(), the same functions the pipeline uses.
+#-----------------------------------------------------------------
+
+MAX_FETCH_WORKERS = 8
+PROFILE_CACHE_TTL = int(os.environ.get('WELLBEING_PROFILE_TTL', 24 * 3600))
+TITLE = 'Health in well-being economy analysis tool'
+
+
+def profile_indicators(indicators_df):
+    return indicators_df[indicators_df['Country_Profile'] == True]
+
+
+#-----------------------------------------------------------------
+# Fetch stage: all the indicators are fetched concurrently, with a limit on
+# the parallel requests sent to each host; sources with a batch API get
+# several indicators per request
+#-----------------------------------------------------------------
+def fetch_indicator(source, url_code):
+    #snapshot first, then the revalidated local copy (refresh.py)
+    url_a, url_b = loaders.indicator_urls(source, url_code)
+
+    with transport.host_limit(url_a), instrument.stage('load', source=source, code=url_code) as info:
+        found = snapshot.load_indicator(source, url_code)
+        gdp_df, meta = found if found is not None else refresh.load_indicator(source, url_code)
+        info['rows'] = len(gdp_df)
+    return gdp_df
+
+
+def fetch_batch(source, url_codes):
+    url = loaders.batch_urls(source, url_codes)
+
+    with transport.host_limit(url), instrument.stage('load', source=source, codes=len(url_codes)) as info:
+        found = loaders.load_indicators_batch(source, url_codes)
+        info['rows'] = sum(len(gdp_df) for gdp_df, meta in found.values())
+
+    #kept as local copies, so they have a data version and are not fetched again while fresh
+    for url_code, (gdp_df, meta) in found.items():
+        refresh.store_indicator(source, url_code, gdp_df, meta)
+    return found
+
+
+def fetch_profile_indicators(rows, on_thread=None):
+    #yields (row, gdp_df, error) in catalog order, each one as soon as it has arrived;
+    #WHO/Europe and World Bank indicators missing from the snapshot are fetched in batches.
+    #on_thread() runs first in every worker (e.g. to attach the Streamlit script context)
+    run = instrument.current_run()
+
+    def in_worker(fn, *args):
+        if on_thread is not None: on_thread()
+        instrument.bind_run(run)
+        return fn(*args)
+
+    batched = {}
+    for row in rows:
+        source, url_code = row['Indicator.datasource'], str(row['Indicator_Code'])
+        if (source in loaders.BATCH_SIZES) and (snapshot.load_indicator_meta(source, url_code) is None) and not refresh.is_fresh(source, url_code):
+            batched.setdefault(source, [])
+            if url_code not in batched[source]: batched[source].append(url_code)
+
+    with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as executor:
+        batch_of = {}
+        for source, url_codes in batched.items():
+            for chunk in loaders.batch_chunks(source, url_codes):
+                future = executor.submit(in_worker, fetch_batch, source, chunk)
+                for url_code in chunk: batch_of[(source, url_code)] = future
+
+        futures = [None if (row['Indicator.datasource'], str(row['Indicator_Code'])) in batch_of
+                   else executor.submit(in_worker, fetch_indicator, row['Indicator.datasource'], row['Indicator_Code']) for row in rows]
+
+        for row, future in zip(rows, futures):
+            source, url_code = row['Indicator.datasource'], str(row['Indicator_Code'])
+            try:
+                if future is not None:
+                    yield row, future.result(), None
+                    continue
+
+                try:
+                    found = batch_of[(source, url_code)].result()
+                except Exception as e:
+                    instrument.log('batch failed', level=logging.WARNING, source=source, error=repr(e))
+                    found = {}
+                #not in the combined answer: loaded on its own
+                yield row, found[url_code][0] if url_code in found else fetch_indicator(source, row['Indicator_Code']), None
+            except Exception as e:
+                yield row, None, e
+
+
+#-----------------------------------------------------------------
+# Profile cache: a finished profile job is served again as long as the
+# country, the Country_Profile rows of the catalog and the data versions of
+# the indicators are the same, and it is younger than PROFILE_CACHE_TTL.
+# The versions are those stored locally: the lookup makes no request, and
+# stale copies are revalidated by the next job that builds a profile, at the
+# latest when the cached one expires. An indicator
+# that could not be fetched has no version, in the key of the job as in the
+# lookup, so it does not prevent a hit.
+#-----------------------------------------------------------------
+def catalog_hash(indi_df):
+    return hashlib.sha256(indi_df.to_json(orient='records', date_format='iso').encode()).hexdigest()
+
+
+def indicator_version(source, url_code):
+    #validators of the snapshot entry or of the local copy; without validators the snapshot
+    #version or the content hash of the local copy (the check time for copies older than it)
+    meta = snapshot.load_indicator_meta(source, url_code)
+    if meta is not None: return meta.get('validators') or snapshot.current_version()
+
+    entry = refresh.cached_entry(source, url_code)
+    if entry is not None: return entry['meta'].get('validators') or entry.get('content') or entry['checked']
+    return None
+
+
+def profile_key(country, indi_df):
+    versions = [[str(source), str(url_code), indicator_version(source, str(url_code))]
+                for source, url_code in indi_df[['Indicator.datasource', 'Indicator_Code']].itertuples(index=False)]
+    text = json.dumps([country, catalog_hash(indi_df), versions], sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def cached_profile(country, indi_df, ttl=PROFILE_CACHE_TTL):
+    #id of a finished profile job with the same inputs, or None
+    key = profile_key(country, indi_df)
+    for job in jobs.list_jobs('profile', country):
+        if (job['status'] == 'done') and job['result'] and (job['result'].get('key') == key) and (time.time() - job['created'] < ttl):
+            return job['id']
+    return None
+
+
+#-----------------------------------------------------------------
+# Chart and table of one indicator
+#-----------------------------------------------------------------
+def chart_dims(dtc):
+    #dimensions drawn as separate lines: Country Code only when there is no other one
+    dims = [dim for dim in dtc.columns if ((dim != 'Year') and (dim != 'Value'))]
+    if (len(dims) > 1): dims.remove("Country Code")
+    return dims
+
+
+def profile_chart(dtc):
+    # Calculate the min and max of the 'Value' column, and the range for the y-axis around the center
+    value_min = dtc['Value'].min()
+    value_max = dtc['Value'].max()
+    center = (value_min + value_max) / 2
+    y_min = center - (value_max - value_min)/2 * 1.2
+    y_max = center + (value_max - value_min)/2 * 1.2
+
+    return alt.Chart(dtc).mark_line(point=True).encode(
+        x=alt.X('Year:Q', axis=alt.Axis(format='d')),
+        y=alt.Y('Value:Q', scale=alt.Scale(domain=[y_min, y_max])),
+        color = "".join(chart_dims(dtc)),
+        tooltip=['Year', 'Value', 'Country Code']
+        ).properties().interactive()
+
+
+def profile_table(dtc):
+    return pd.pivot_table(dtc, index=chart_dims(dtc), columns="Year", values="Value", aggfunc='sum', observed=True).round(2)
+
+
+def indicator_section(row, gdp_df, error, iso3, iso2):
+    #returns (section, dtc): the section describes the indicator, dtc is its data for the country (or None)
+    source = row['Indicator.datasource']
+    url_code = row['Indicator_Code']
+    url_a, url_b = loaders.indicator_urls(source, url_code)
+    section = {'title': str(source) + " - " + str(row['Indicator.short_name']), 'source': source,
+               'code': str(url_code), 'link': url_a, 'status': 'no data'}
+
+    if error is not None:
+        instrument.log('fetch failed', level=logging.ERROR, code=url_code, error=repr(error))
+        section['error'] = repr(error)
+        return section, None
+
+    #filtering data by country selection
+    with instrument.stage('filter', code=url_code, rows=len(gdp_df)):
+        dtc = gdp_df[(gdp_df['Country Code'].isin(iso2 if source == "EUROSTAT" else iso3))]
+    dtc = dtc.dropna()
+    if len(dtc) == 0: return section, None
+
+    section['status'] = 'ok'
+    return section, dtc.reset_index(drop=True)
+
+
+def profile_section(i, row, gdp_df, error, iso3, iso2, save=None):
+    #one indicator of a profile: (section, doc_section with chart spec and table text,
+    #data of the country, pivot table), the last two None without data
+    section, dtc = indicator_section(row, gdp_df, error, iso3, iso2)
+    doc_section = {'title': section['title'], 'spec': None, 'table': None}
+    if dtc is None: return section, doc_section, None, None
+
+    section['data'] = 'data-%03d.parquet' % i
+    if save is not None: save(section['data'], dtc)
+
+    #plot for the Word file, rendered to PNG after the loop
+    doc_section['spec'] = profile_chart(dtc).to_json()
+
+    #pivoting data to show table below the chart
+    with instrument.stage('pivot', code=section['code'], rows=len(dtc)):
+        pivot_data = profile_table(dtc)
+    doc_section['table'] = pivot_data.to_string()
+    return section, doc_section, dtc, pivot_data
+
+
+def profile_prompt(frames, tables, save=None):
+    #statistical summary of the indicators (summary.py) as the AI prompt data: returns (text, report)
+    stats = summary.summarize(frames)
+    if save is not None:
+        for name, df in stats.items(): save('summary-' + name + '.parquet', df)
+    prompt0, prompt_report = prompt.data_prompt(tables, summary.summary_blocks(stats, [title for title, dtc in frames]))
+    if save is not None: save('prompt.json', prompt_report)
+    return prompt0, prompt_report
+
+
+def ai_reports(country, prompt0, progress=None, save=None):
+    #first prompt related to data analysis, then the report sections asked concurrently on top of it;
+    #every answer is saved while it streams in (analysis.md, report-<section>.md): returns (analysis, report)
+    instrument.log('ai data', country=country, chars=len(prompt0))
+    total = 1 + len(REPORT_SECTIONS)
+
+    def saver(name):
+        return (lambda text: save(name, text)) if save else None
+
+    if progress: progress('llm', 0, total, "Data analysis in progress... Country: " + country)
+    messages = [{"role": "user", "content": analysis_prompt(country, prompt0)}]
+    analysis = llm.chat(messages, 'data analysis', saver('analysis.md'))
+    messages.append({"role": "assistant", "content": analysis})
+
+    if progress: progress('llm', 1, total, "Report in progress... Country: " + country)
+    run = instrument.current_run()
+
+    def section_report(section):
+        instrument.bind_run(run)
+        return llm.chat(messages + [{"role": "user", "content": report_prompt(country, section)}], 'report ' + section, saver('report-' + section + '.md'))
+
+    texts = {}
+    with ThreadPoolExecutor(max_workers=MAX_LLM_CONCURRENCY) as executor:
+        futures = {executor.submit(section_report, section): section for section in REPORT_SECTIONS}
+        for future in as_completed(futures):
+            texts[futures[future]] = future.result()
+            if progress: progress('llm', 1 + len(texts), total, "Report in progress... Country: " + country)
+
+    #assembled in order
+    report = '\n\n'.join('## ' + report_title(section) + '\n\n' + texts[section] for section in REPORT_SECTIONS)
+    if save: save('report.md', report)
+    return analysis, report
+
+
+def report_title(section):
+    return "Summary of recommendations" if section == 'summary' else CAPITALS[section][0]
+
+
+#-----------------------------------------------------------------
+# AI reports
+#-----------------------------------------------------------------
+def analysis_prompt(country, data_text):
+    return "You are an experienced data scientist. Use the following data for country " + country + " and provide comment on trends and relations between indicators collected. Elaborate a concise report highlighting differences for males and females, for age groups, for groups with different education or income, for groups living in urban areas compared to rural, and trends over time" + data_text + " Do not add introductions or conclusions. No AI disclaimers or pleasantries. Use bullet points, titles and text."
+
+
+#report of the second call, in sections: one per well-being capital and the summary table,
+#generated concurrently (the texts are those of the former single 5 page request)
+REPORT_INTRO = """has a several laws and regulation related to health sector. Collect them for your reference. Your scope is to create a document with a different vision of health. Health is both a foundation and a goal of well-being economies. Health systems are not only economic sectors in their own right—employing millions and generating social value—but also key enablers of human development, social cohesion, and environmental sustainability. The vision will strengthen national capacities to generate, govern, and use health-related data to inform policies that promote equitable, resilient, and prosperous societies.
+            The vision works on 4 well-being capitals: Human well-being, Social well-being, Planetary well-being, Economic well-being."""
+
+CAPITALS = {
+    'human': ("Human well-being", "Human well-being is important because people's health and their subjective well-being are closely linked; both are drivers of economic prosperity, social mobility and cohesion. Human well-being is measured by indicators like: Healthy life expectancy, Mental health and well‑being, Ability to carry out daily activities free from illness, Universal Health Coverage, Quality and non‑discriminatory health & social care, Universal policies for housing food and fuel security, Early childhood development, Lifelong learning and literacy, Safe, orderly & regular migration."),
+    'social': ("Social well-being", "Social well-being is represented by Trust, participation and social cohesion make significant contributions to mental and physical health and well-being, and are vital to building fair, peaceful, and resilient societies. Social well-being is measured by Living in safety and free from violence, Sense of belonging (“Mattering”), Social cohesion and embracing diversity, Perceived ability to influence politics and decisions, Social support and protection, Building trust in others and in institutions, Public spending on communities, Participation in volunteering."),
+    'planetary': ("Planetary well-being", "Planetary well-being is a key determinant of physical, mental and social well-being for current and future generations. It is also essential for economic prosperity. Environmental damage has significant negative impacts on well-being and prosperity. Planetary well-being is measured by Good air and water quality, Healthy and sustainable living environment, Sustainable public transport and active travel, Access to safe green space, Stable climate Biodiversity and natural capital, Circular economy and green technology."),
+    'economic': ("Economic well-being", "Economic well-being impacts physical and mental health and well-being and is essential to ensure that people have a sustainable income, as well as assets, so that they can prosper and participate in society. It's measured by Living wage, Universal social protection through the life‑course, Decent and psychologically safe work, Gender‑responsive employment, Social dialogue and collective bargaining, Economic cohesion and balanced development."),
+}
+
+PUBLICATIONS = "Potential actions and activities carried by stakeholders to promote well-being are also mentioned in the WHO publications 'Health in the well-being economy' WHO/EURO:2023-7144-46910-68439 and in 'Deep dives on the well-being economy showcasing the experiences of Finland, Iceland, Scotland and Wales: summary of key findings' WHO/EURO:2023-7033-46799-68216. Please take inspiration by these publication whilst you prepare your report."
+
+REPORT_SECTIONS = list(CAPITALS) + ['summary']
+MAX_LLM_CONCURRENCY = 3
+
+
+def report_prompt(country, section):
+    head = "You are a senior political advisor and you have to prepare a report with actionable points related to public health goods and services plan to be provided in your country. The country to focus is " + country + "." + country + " " + REPORT_INTRO
+    tail = " Do not add introductions or conclusions. No AI disclaimers or pleasantries. Use bullet points, titles and text."
+
+    if section == 'summary':
+        return (head + "\n            " + "\n            ".join(text for name, text in CAPITALS.values()) + "\n            " + PUBLICATIONS +
+                "\n            Based on the data given previously for " + country + ", make a summary table of recommendations, with well-being capitals as rows and key actions, legal/policy basis, expected impact as columns. Provide only the table." + tail)
+
+    name, text = CAPITALS[section]
+    return (head + "\n            " + text + "\n            " + PUBLICATIONS +
+            "\n            Elaborate on the data given previously for " + country + " around the " + name + " capital and its indicators (where possible disaggregated by sex, gender, and age), if it's needed collect additional data and describe what are the key points to be considered for planning goods and services to promote " + name + "." +
+            "\n            Provide a section of a report (about one page) with actions for " + name + " with content reference and data sources. Reason your points in relation to health laws and policies and data provided by highlighting data and relations among indicators." +
+            "\n            Highlight data improvements that could be depending by the implementation of a law, expand key actions for " + name + " by reasoning the choice with your comments and recommendations." + tail)
+
+
+#-----------------------------------------------------------------
+# Word file
+#-----------------------------------------------------------------
+def build_docx(heading, sections, pngs, analysis, report):
+    #python-docx is imported by the export only
+    from docx import Document
+    from docx.shared import Inches
+
+    doc = Document()
+    doc.add_heading(TITLE, 0)
+    doc.add_paragraph(heading)
+
+    pngs = iter(pngs)
+    for section in sections:
+        doc.add_paragraph(section['title'], style="Heading 1")
+        if section.get('spec') is not None:
+            img_buffer = BytesIO(next(pngs))
+            img_buffer.name = 'chart.png'  # python-docx expects .name attribute
+            doc.add_picture(img_buffer, width=Inches(6))
+        if section.get('table') is not None:
+            doc.add_paragraph(section['table'])
+
+    doc.add_paragraph("****** AI data report:" + analysis)
+    doc.add_paragraph("****** AI report:" + report)
+
+    with instrument.stage('docx') as info:
+        doc_buffer = BytesIO()
+        doc.save(doc_buffer)
+        info['bytes'] = doc_buffer.tell()
+    return doc_buffer.getvalue()
+
+
+#-----------------------------------------------------------------
+# The whole profile
+#-----------------------------------------------------------------
+def profile_heading(country, n):
+    return "Selected indicators to be elaborated: " + str(n) + " - Country: " + country
+
+
+def build_profile(country, iso3, iso2, indi_df, progress, save, on_thread=None):
+    #saves: sections.json (list of sections), data-NNN.parquet (data of section NNN),
+    #analysis.md, report.md, <country>.docx; returns the name of the Word file and the profile cache key
+    rows = [row for index, row in indi_df.iterrows()]
+    heading = profile_heading(country, len(rows))
+    save('heading.txt', heading)
+
+    sections = []
+    doc_sections = []
+    frames = []
+    tables = []
+    progress('fetch', 0, len(rows), "Fetching the indicators")
+
+    #iterate all the indicators to be included in the report, fetched concurrently
+    for i, (row, gdp_df, error) in enumerate(fetch_profile_indicators(rows, on_thread)):
+        section, doc_section, dtc, pivot_data = profile_section(i, row, gdp_df, error, iso3, iso2, save)
+        if dtc is not None:
+            frames.append((section['title'], dtc))
+            tables.append((section['title'], pivot_data))
+
+        sections.append(section)
+        doc_sections.append(doc_section)
+        save('sections.json', sections)
+        progress('fetch', i + 1, len(rows), section['title'])
+
+    #rendering all the charts of the profile in parallel (cached by spec and data)
+    progress('png', 0, 1, "Rendering the charts")
+    pngs = render.render_pngs([section['spec'] for section in doc_sections if section['spec'] is not None])
+
+    #summary of the data for the AI, within the token budget
+    prompt0, prompt_report = profile_prompt(frames, tables, save)
+    analysis, report = ai_reports(country, prompt0, progress, save)
+
+    progress('docx', 0, 1, "Preparing the Word file...")
+    docx_name = country + ".docx"
+    save(docx_name, build_docx(heading, doc_sections, pngs, analysis, report))
+
+    #key of the profile cache, taken after the fetch so every indicator has a data version
+    return {'docx': docx_name, 'key': profile_key(country, indi_df)}
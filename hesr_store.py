@@ -0,0 +1,163 @@
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+#-----------------------------------------------------------------
+# Columnar store for the HESR equity workbooks
+#
+# HESR1.xlsx / HESR2.xlsx are parsed once with openpyxl and written as one
+# Parquet file per 'indicator_abbr' under
+# data/.cache/hesr/<workbook>/<version>/. The manifest of the workbook
+# points to the current version and keeps the mtime and size of the source
+# workbook: when the workbook changes the store is rebuilt, otherwise
+# loading one indicator only reads that indicator's rows.
+# Next to every indicator the store keeps its latest-year view: for each
+# country, age group, sex, dimension and Education/Income level the row of
+# the latest year with a value, the data of the dumbbell chart when the
+# whole period is selected (load_latest). The threads of a process build a
+# store one at a time; the others wait and read the manifest it wrote.
+#-----------------------------------------------------------------
+
+CACHE_DIR = Path(__file__).parent/'data/.cache/hesr'
+MANIFEST = 'manifest.json'
+STORE_FORMAT = 4
+NOT_KEYS = ('Year', 'Value', 'population')
+
+_lock = threading.Lock()
+
+
+def source_stamp(data_filename):
+    stat = os.stat(data_filename)
+    return {'source': str(data_filename), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def _store_dir(data_filename):
+    return CACHE_DIR/Path(data_filename).stem
+
+
+def _read_manifest(store_dir):
+    try:
+        with open(store_dir/MANIFEST) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_current(manifest, stamp):
+    return ((manifest is not None) and (manifest.get('format') == STORE_FORMAT)
+            and (manifest.get('mtime_ns') == stamp['mtime_ns']) and (manifest.get('size') == stamp['size']))
+
+
+def build_store(data_filename):
+    with _lock:
+        return _build_store(data_filename)
+
+
+def _build_store(data_filename):
+    store_dir = _store_dir(data_filename)
+    stamp = source_stamp(data_filename)
+
+    hesr = pd.read_excel(data_filename)
+    df = pd.DataFrame(hesr)
+
+    #every build writes its own version folder; writing the manifest that points to it is the
+    #switch (one os.replace), so readers always find a complete store, the old or the new one
+    version = '%d-%d-%d' % (stamp['mtime_ns'], os.getpid(), threading.get_ident())
+    version_dir = store_dir/version
+    shutil.rmtree(version_dir, ignore_errors=True)
+    version_dir.mkdir(parents=True)
+
+    indicators = {}
+    latest = {}
+    for i, (code, part) in enumerate(df.groupby('indicator_abbr', sort=True)):
+        part = part.reset_index(drop=True)
+        part_name = 'part-%04d.parquet' % i
+        part.to_parquet(version_dir/part_name, index=False)
+        indicators[str(code)] = part_name
+
+        latest_name = 'latest-%04d.parquet' % i
+        latest_rows(part).to_parquet(version_dir/latest_name, index=False)
+        latest[str(code)] = latest_name
+
+    stamp['format'] = STORE_FORMAT
+    stamp['version'] = version
+    stamp['indicators'] = indicators
+    stamp['latest'] = latest
+    stamp['columns'] = list(df.columns)
+    tmp = store_dir/(MANIFEST + '.tmp%d-%d' % (os.getpid(), threading.get_ident()))
+    with open(tmp, 'w') as f:
+        json.dump(stamp, f)
+    os.replace(tmp, store_dir/MANIFEST)
+
+    _prune_versions(store_dir, version)
+    return stamp
+
+
+def _prune_versions(store_dir, version):
+    #keeps the new version and the one before it, which readers of the previous manifest may still be reading
+    folders = sorted((child for child in store_dir.iterdir() if child.is_dir() and child.name != version),
+                     key=lambda child: child.stat().st_mtime, reverse=True)
+    for folder in folders[1:]:
+        shutil.rmtree(folder, ignore_errors=True)
+    #files of the stores written before the version folders
+    for old in store_dir.glob('*.parquet'):
+        old.unlink(missing_ok=True)
+
+
+def latest_keys(columns):
+    #a series of a HESR indicator: every column but the year, the value and the population
+    #(indicator, country, age group, sex, dimension, Education and Income levels)
+    return [col for col in columns if col not in NOT_KEYS]
+
+
+def latest_rows(part):
+    #the row of the latest year of every series, among the complete rows
+    part = part.dropna()
+    keys = latest_keys(part.columns)
+    if part.empty or ('Year' not in part.columns) or not keys: return part
+    years = pd.to_numeric(part['Year'])
+    return part.loc[years.groupby([part[key] for key in keys], sort=False, observed=True).idxmax()].reset_index(drop=True)
+
+
+def open_store(data_filename):
+    #returns the manifest, rebuilding the store if the workbook changed
+    store_dir = _store_dir(data_filename)
+    stamp = source_stamp(data_filename)
+    manifest = _read_manifest(store_dir)
+    if _is_current(manifest, stamp): return manifest
+
+    with _lock:
+        #another thread may have rebuilt the store while this one waited
+        manifest = _read_manifest(store_dir)
+        if not _is_current(manifest, stamp): manifest = _build_store(data_filename)
+    return manifest
+
+
+def load_indicator(data_filename, url_code):
+    manifest = open_store(data_filename)
+    part_name = manifest['indicators'].get(str(url_code))
+
+    if part_name is None:
+        #unknown indicator: same columns as the workbook, no rows
+        return pd.DataFrame(columns=manifest['columns'])
+    return pd.read_parquet(_store_dir(data_filename)/manifest['version']/part_name)
+
+
+def load_latest(data_filename, url_code):
+    #the latest-year view of the indicator (see latest_rows), None for an unknown indicator
+    manifest = open_store(data_filename)
+    latest_name = manifest['latest'].get(str(url_code))
+
+    if latest_name is None: return None
+    return pd.read_parquet(_store_dir(data_filename)/manifest['version']/latest_name)
+
+
+if __name__ == '__main__':
+    #python hesr_store.py -> (re)build the stores for every HESR workbook found in data/
+    for data_filename in sorted((Path(__file__).parent/'data').glob('HESR*.xlsx')):
+        manifest = build_store(data_filename)
+        print(data_filename.name, '->', len(manifest['indicators']), 'indicators')
@@ -0,0 +1,90 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+#-----------------------------------------------------------------
+# Per-stage instrumentation of a rerun
+#
+#   run = instrument.new_run("Country Profile")
+#   with instrument.stage("fetch", source="EUROSTAT") as info:
+#       ...
+#       info['rows'] = len(df)
+#
+# Every stage is logged as one JSON line on the "wellbeing" logger and kept
+# in the run, so the app can show where a rerun spent its time
+# (diagnostics_frame). Worker threads join the run with bind_run(run).
+#-----------------------------------------------------------------
+
+logger = logging.getLogger('wellbeing')
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(os.environ.get('WELLBEING_LOG_LEVEL', 'INFO'))
+    logger.propagate = False
+
+_local = threading.local()
+
+
+def new_run(label):
+    run = {'label': label, 'started': time.time(), 'stages': [], 'lock': threading.Lock()}
+    _local.run = run
+    return run
+
+
+def bind_run(run):
+    _local.run = run
+
+
+def current_run():
+    return getattr(_local, 'run', None)
+
+
+def log(event, level=logging.DEBUG, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({'event': event, **fields}, default=str))
+
+
+@contextmanager
+def stage(name, **fields):
+    #fields (and whatever the caller puts in the yielded dict: rows, bytes...) go into the record
+    info = dict(fields)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield info
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        record = {'stage': name, 'ms': round((time.perf_counter() - start) * 1000, 1), 'thread': threading.current_thread().name, **info}
+        if error is not None: record['error'] = error
+
+        run = current_run()
+        if run is not None:
+            with run['lock']:
+                run['stages'].append(record)
+        log('stage', level=logging.INFO, run=run['label'] if run else None, **record)
+
+
+def diagnostics_frame(run):
+    #one row per stage record, in completion order
+    if run is None or not run['stages']:
+        return pd.DataFrame(columns=['stage', 'ms', 'rows', 'bytes'])
+    with run['lock']:
+        return pd.DataFrame(run['stages'])
+
+
+def diagnostics_summary(run):
+    #totals per stage name
+    df = diagnostics_frame(run)
+    if df.empty: return df
+    for col in ['rows', 'bytes']:
+        if col not in df.columns: df[col] = float('nan')
+    return df.groupby('stage', sort=False).agg(calls=('ms', 'size'), total_ms=('ms', 'sum'), max_ms=('ms', 'max'),
+                                                rows=('rows', 'sum'), bytes=('bytes', 'sum'))
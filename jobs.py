@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+import instrument
+
+#-----------------------------------------------------------------
+# Background jobs with persisted progress and results
+#
+#   job_id = jobs.submit('profile', country, country_profile.build_profile, country=...)
+#   job = jobs.read_job(job_id)      # status, progress, result
+#   jobs.load_artifact(job_id, 'sections.json')
+#
+# A job runs in a thread of this process, outside any Streamlit script run,
+# so a rerun or a closed tab does not lose it. data/.jobs/<job_id>/job.json
+# holds its status and progress; the job function writes its outputs next
+# to it with save(name, value). A job that was running when the server
+# stopped is read back as 'interrupted'. Finished jobs are kept for
+# JOB_TTL, and at most the MAX_KEPT_JOBS newest ones (prune, run at every
+# submit); the profile cache (country_profile.py) serves them meanwhile.
+#-----------------------------------------------------------------
+
+JOBS_DIR = Path(__file__).parent/'data/.jobs'
+JOB_FILE = 'job.json'
+MAX_JOBS = 2
+ACTIVE = ('queued', 'running')
+JOB_TTL = int(os.environ.get('WELLBEING_JOB_TTL', 7 * 24 * 3600))
+MAX_KEPT_JOBS = 50
+
+_executor = ThreadPoolExecutor(max_workers=MAX_JOBS, thread_name_prefix='job')
+_active = set()
+_lock = threading.Lock()
+
+
+def job_dir(job_id):
+    return JOBS_DIR/job_id
+
+
+def _write_json(path, value):
+    tmp = path.with_name(path.name + '.tmp' + str(threading.get_ident()))
+    with open(tmp, 'w') as f:
+        json.dump(value, f, indent=1, default=str)
+    os.replace(tmp, path)
+
+
+def read_job_file(job_id):
+    with open(job_dir(job_id)/JOB_FILE) as f:
+        return json.load(f)
+
+
+def read_job(job_id):
+    #job.json as seen by the page: a job no longer running in this process is 'interrupted'
+    try:
+        job = read_job_file(job_id)
+    except (OSError, ValueError):
+        return None
+
+    with _lock:
+        if (job['status'] in ACTIVE) and (job_id not in _active): job['status'] = 'interrupted'
+    return job
+
+
+def update(job_id, **fields):
+    with _lock:
+        job = read_job_file(job_id)
+        job.update(fields, updated=time.time())
+        _write_json(job_dir(job_id)/JOB_FILE, job)
+    return job
+
+
+def list_jobs(kind=None, key=None):
+    #newest first
+    found = []
+    if not JOBS_DIR.exists(): return found
+    for path in JOBS_DIR.iterdir():
+        job = read_job(path.name) if path.is_dir() else None
+        if job is None: continue
+        if ((kind is None) or (job['kind'] == kind)) and ((key is None) or (job['key'] == key)): found.append(job)
+    return sorted(found, key=lambda job: job['created'], reverse=True)
+
+
+def save_artifact(job_id, name, value):
+    path = job_dir(job_id)/name
+    if isinstance(value, (pd.DataFrame, bytes, str)):
+        #written aside and swapped in: the page may read an artifact that is still being written
+        tmp = path.with_name(path.name + '.tmp' + str(threading.get_ident()))
+        if isinstance(value, pd.DataFrame): value.to_parquet(tmp, index=False)
+        elif isinstance(value, bytes): tmp.write_bytes(value)
+        else: tmp.write_text(value, encoding='utf-8')
+        os.replace(tmp, path)
+    else:
+        _write_json(path, value)
+
+
+def load_artifact(job_id, name):
+    #None when the job has not written it (yet)
+    path = job_dir(job_id)/name
+    if not path.exists(): return None
+    match path.suffix:
+        case '.parquet': return pd.read_parquet(path)
+        case '.json':
+            with open(path) as f:
+                return json.load(f)
+        case '.txt' | '.md': return path.read_text(encoding='utf-8')
+        case _: return path.read_bytes()
+
+
+def submit(kind, key, fn, **kwargs):
+    #runs fn(progress=..., save=..., **kwargs) in the background; a job of the same
+    #kind and key still running is reused instead of starting a second one
+    with _lock:
+        for job_id in _active:
+            job = read_job_file(job_id)
+            if (job['kind'] == kind) and (job['key'] == key): return job_id
+
+        job_id = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ') + '-' + uuid.uuid4().hex[:8]
+        job_dir(job_id).mkdir(parents=True)
+        _write_json(job_dir(job_id)/JOB_FILE, {'id': job_id, 'kind': kind, 'key': key, 'status': 'queued',
+                                               'progress': {'stage': None, 'done': 0, 'total': 0, 'message': 'Waiting to start'},
+                                               'created': time.time(), 'updated': time.time(), 'result': None, 'error': None})
+        _active.add(job_id)
+
+    _executor.submit(_run, job_id, fn, kwargs)
+    prune()
+    return job_id
+
+
+def prune(ttl=JOB_TTL, keep=MAX_KEPT_JOBS):
+    #removes the jobs not running in this process that ended more than ttl ago, and the
+    #ones beyond the keep newest (job ids start with their creation time)
+    if not JOBS_DIR.exists(): return
+    now = time.time()
+    kept = 0
+    for path in sorted((path for path in JOBS_DIR.iterdir() if path.is_dir()), key=lambda path: path.name, reverse=True):
+        with _lock:
+            if path.name in _active: continue
+        try:
+            ended = (path/JOB_FILE).stat().st_mtime
+        except OSError:
+            ended = path.stat().st_mtime
+        if (now - ended < ttl) and (kept < keep):
+            kept += 1
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _run(job_id, fn, kwargs):
+    run = instrument.new_run('job ' + job_id)
+
+    def progress(stage, done, total, message=''):
+        update(job_id, progress={'stage': stage, 'done': done, 'total': total, 'message': message})
+
+    def save(name, value):
+        save_artifact(job_id, name, value)
+
+    try:
+        update(job_id, status='running', started=time.time())
+        result = fn(progress=progress, save=save, **kwargs)
+        update(job_id, status='done', result=result, timings=_timings(run))
+    except Exception as e:
+        instrument.log('job failed', level=logging.ERROR, job=job_id, error=repr(e))
+        update(job_id, status='failed', error=repr(e), timings=_timings(run))
+    finally:
+        with _lock:
+            _active.discard(job_id)
+
+
+def _timings(run):
+    summary = instrument.diagnostics_summary(run)
+    return summary.reset_index().to_dict('records') if not summary.empty else []
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import instrument
+
+#-----------------------------------------------------------------
+# Access layer for the LLM calls
+#
+#   text = llm.chat(messages, 'data analysis', on_text=show)
+#
+# Every answer is cached on disk by the hash of the model name and the
+# messages, so the same request with the same data is answered at once.
+# The backend is the OpenAI API, or any server speaking its chat
+# completions protocol when WELLBEING_LLM_BASE_URL (or set_base_url) points
+# to it, e.g. the stand-in of benchmarks/llm_standin.py. Every call is
+# recorded with its latency and token usage: call_metrics keeps the last
+# MAX_CALL_METRICS calls, llm_metrics the totals of the process.
+#-----------------------------------------------------------------
+
+LLM_MODEL = "gpt-4.1-mini"
+LLM_CACHE_DIR = Path(__file__).parent/'data/.cache/llm'
+LLM_CACHE = os.environ.get('WELLBEING_LLM_CACHE', '1') != '0'
+STREAM_FLUSH_SECONDS = 0.5
+MAX_CALL_METRICS = 1000
+
+_config = {'api_key': os.environ.get('OPENAI_API_KEY'), 'base_url': os.environ.get('WELLBEING_LLM_BASE_URL') or None}
+_client = None
+_client_lock = threading.Lock()
+_calls = deque(maxlen=MAX_CALL_METRICS)
+_totals = {}
+_calls_lock = threading.Lock()
+
+
+def configure(api_key=None, base_url=None):
+    #a new key or backend takes effect on the next call
+    global _client
+    with _client_lock:
+        if api_key is not None: _config['api_key'] = api_key
+        if base_url is not None: _config['base_url'] = base_url or None
+        _client = None
+
+
+def set_base_url(base_url):
+    configure(base_url=base_url or '')
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            from openai import OpenAI
+            _client = OpenAI(api_key=_config['api_key'] or 'not-needed', base_url=_config['base_url'])
+        return _client
+
+
+def cache_key(model, messages):
+    text = json.dumps({'model': model, 'messages': messages}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _read_cache(key):
+    try:
+        with open(LLM_CACHE_DIR/(key + '.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(key, entry):
+    LLM_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = LLM_CACHE_DIR/(key + '.json')
+    tmp = path.with_name(path.name + '.tmp' + str(threading.get_ident()))
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _record(metrics):
+    with _calls_lock:
+        _calls.append(metrics)
+        t = _totals.setdefault('cached' if metrics['cached'] else 'live', {'calls': 0, 'seconds': 0.0, 'tokens_in': 0, 'tokens_out': 0})
+        t['calls'] += 1
+        t['seconds'] += metrics['ms'] / 1000
+        t['tokens_in'] += metrics.get('tokens_in') or 0
+        t['tokens_out'] += metrics.get('tokens_out') or 0
+
+
+def call_metrics():
+    #one dict per call, the last MAX_CALL_METRICS of this process: call, model, cached, ms, first_token_ms, tokens_in, tokens_out
+    with _calls_lock:
+        return list(_calls)
+
+
+def llm_metrics():
+    #totals of this process, cached and live calls apart
+    with _calls_lock:
+        return {kind: dict(t) for kind, t in _totals.items()}
+
+
+def chat(messages, call, on_text=None, model=LLM_MODEL, use_cache=LLM_CACHE):
+    #streamed answer; on_text(text so far) is called at most every STREAM_FLUSH_SECONDS, and at the end
+    key = cache_key(model, messages)
+
+    with instrument.stage('llm', call=call, bytes=sum(len(m['content']) for m in messages)) as info:
+        start = time.perf_counter()
+        cached = _read_cache(key) if use_cache else None
+
+        if cached is not None:
+            text = cached['text']
+            info.update(cached=True, tokens_in=cached.get('tokens_in'), tokens_out=cached.get('tokens_out'))
+            if on_text is not None: on_text(text)
+        else:
+            info['cached'] = False
+            text = _stream(messages, model, info, on_text, start)
+            if use_cache:
+                _write_cache(key, {'model': model, 'call': call, 'text': text, 'created': time.time(),
+                                   'tokens_in': info.get('tokens_in'), 'tokens_out': info.get('tokens_out')})
+
+        _record({'call': call, 'model': model, 'cached': info['cached'], 'ms': round((time.perf_counter() - start) * 1000, 1),
+                 'first_token_ms': info.get('first_token_ms'), 'tokens_in': info.get('tokens_in'), 'tokens_out': info.get('tokens_out')})
+    return text
+
+
+def _stream(messages, model, info, on_text, start):
+    stream = get_client().chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True}
+        )
+
+    parts = []
+    flushed = start
+    for chunk in stream:
+        if chunk.usage is not None:
+            info['tokens_in'] = chunk.usage.prompt_tokens
+            info['tokens_out'] = chunk.usage.completion_tokens
+        if not chunk.choices or not chunk.choices[0].delta.content: continue
+
+        if not parts: info['first_token_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        parts.append(chunk.choices[0].delta.content)
+        if (on_text is not None) and (time.perf_counter() - flushed > STREAM_FLUSH_SECONDS):
+            on_text(''.join(parts))
+            flushed = time.perf_counter()
+
+    text = ''.join(parts)
+    if on_text is not None: on_text(text)
+    return text
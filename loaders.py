@@ -0,0 +1,399 @@
+import pandas as pd
+import transport
+from pathlib import Path
+import json
+import hesr_store
+import instrument
+import reference
+
+#orjson decodes the large WHO/World Bank payloads several times faster than json
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+#-----------------------------------------------------------------
+# Data loaders shared by main.py and chart.py
+#
+# Every loader is a pure function of its arguments: it returns the data
+# frame together with a metadata dict describing the dimensions found
+#   {'sex_split': True/False, 'filter_list': {dimension: [values]}}
+# so that the callers can cache the result per (source, indicator).
+#-----------------------------------------------------------------
+
+SOURCES = ["OECD", "WORLD BANK", "EUROSTAT", "WHO/Europe", "WHO/HESRI", "WHO/HESRI 2"]
+
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
+
+def new_meta():
+    return {'sex_split': False, 'filter_list': {}}
+
+def indicator_urls (source, url_code):
+    #url_a = data request, url_b = page of the indicator on the data source website
+    match source:
+        case "OECD":
+            url_a = "https://sdmx.oecd.org/public/rest/data/" + url_code
+            url_b = "https://data-explorer.oecd.org/vis?df[ds]=dsDisseminateFinalDMZ&df[id]=" + url_code +"&df[ag]=OECD.ELS.HD"
+        case "WORLD BANK":
+            url_a = "https://api.worldbank.org/v2/country/all/indicator/"+ url_code +"?format=json&per_page=20000"
+            url_b = "https://data.worldbank.org/indicator/" + url_code
+        case "EUROSTAT":
+            url_b = "https://ec.europa.eu/eurostat/web/products-datasets/-/"+ url_code
+            url_a = url_b
+        case "WHO/Europe":
+            url_a = "https://dw.euro.who.int/api/v3/Batch/Measures?codes="+ url_code
+            url_b = url_a
+        case _:
+            url_a = "http://worldhealthorg.shinyapps.io/european_health_equity_dataset/"
+            url_b = url_a
+    return url_a, url_b
+
+def who_euro_iso3():
+    #ISO3 codes of the WHO/Europe countries, used to filter batched World Bank requests
+    countries_df = reference.load_table(reference.COUNTRIES)
+    return tuple(countries_df['Countries.code'].dropna().astype(str))
+
+def who_euro_iso2():
+    #ISO2 codes of the WHO/Europe countries, used to filter Eurostat requests
+    countries_df = reference.load_table(reference.COUNTRIES)
+    return tuple(countries_df['Countries.iso2'].dropna().astype(str))
+
+def load_indicator (source, url_code, **filters):
+    #filters (geo, start_year, end_year, dim_filters) are pushed down to the Eurostat API
+    url_a, url_b = indicator_urls(source, url_code)
+
+    match source:
+        case "OECD": gdp_df, meta = get_data_from_OECD(url_a)
+        case "WORLD BANK": gdp_df, meta = get_wb_data(url_a)
+        case "EUROSTAT":
+            filters.setdefault('geo', who_euro_iso2())
+            gdp_df, meta = get_data_from_eurostat(url_code, **filters)
+        case "WHO/Europe": gdp_df, meta = get_data_from_whoeurope(url_a)
+        case "WHO/HESRI" | "WHO/HESRI 2": gdp_df, meta = get_data_from_WHOHESR(url_code, source)
+        case _: raise ValueError("Unknown datasource: " + str(source))
+
+    return finish_indicator(source, url_code, gdp_df, meta)
+
+def finish_indicator (source, url_code, gdp_df, meta):
+    #last step shared by every source: canonical dtypes and memory report
+    with instrument.stage('normalize', source=source, code=url_code, rows=len(gdp_df)) as info:
+        bytes_before = frame_memory(gdp_df)
+        gdp_df = normalize_frame(gdp_df)
+        meta['memory'] = {'rows': len(gdp_df), 'bytes_before': bytes_before, 'bytes_after': frame_memory(gdp_df)}
+        info['bytes'] = meta['memory']['bytes_after']
+    return gdp_df, meta
+
+#-----------------------------------------------------------------
+# Batched requests: several indicators of the same source in one call
+#
+# WHO/Europe takes a comma separated list of measure codes, the World Bank
+# a semicolon separated list of indicators of one of its sources, filtered
+# to the WHO/Europe countries. The combined answer is split back into one
+# (gdp_df, meta) per indicator; the codes missing from it (wrong World Bank
+# source, unknown measure) are left to the single-indicator loaders.
+#-----------------------------------------------------------------
+BATCH_SIZES = {"WHO/Europe": 25, "WORLD BANK": 20}
+WB_SOURCE_ID = 2
+WB_PAGE_SIZE = 20000
+
+def batch_chunks (source, url_codes):
+    size = BATCH_SIZES.get(source, 1)
+    return [url_codes[i:i + size] for i in range(0, len(url_codes), size)]
+
+def batch_urls (source, url_codes):
+    match source:
+        case "WHO/Europe":
+            return "https://dw.euro.who.int/api/v3/Batch/Measures?codes=" + ",".join(url_codes)
+        case "WORLD BANK":
+            return ("https://api.worldbank.org/v2/country/" + ";".join(who_euro_iso3()) + "/indicator/" + ";".join(url_codes) +
+                    "?source=" + str(WB_SOURCE_ID) + "&format=json&per_page=" + str(WB_PAGE_SIZE))
+        case _: raise ValueError("No batched requests for datasource: " + str(source))
+
+def load_indicators_batch (source, url_codes):
+    #returns {url_code: (gdp_df, meta)} for the codes found in the combined answer
+    url = batch_urls(source, url_codes)
+
+    match source:
+        case "WHO/Europe": found = get_whoeurope_batch(url)
+        case "WORLD BANK": found = get_wb_batch(url)
+        case _: raise ValueError("No batched requests for datasource: " + str(source))
+
+    return {url_code: finish_indicator(source, url_code, *found[url_code]) for url_code in url_codes if url_code in found}
+
+def get_whoeurope_batch (url):
+    response = transport.get(url, headers=HEADERS)
+
+    with instrument.stage('parse', source="WHO/Europe", bytes=len(response.content)) as info:
+        found = {measure['code']: parse_whoeurope_measure(measure) for measure in json_loads(response.content)}
+        info['rows'] = sum(len(gdp_df) for gdp_df, meta in found.values())
+    return found
+
+def get_wb_batch (url):
+    #all the pages of the combined answer, then one frame per indicator id
+    records = []
+    page, pages = 1, 1
+    while page <= pages:
+        response = transport.get(url + "&page=" + str(page))
+        datalist = json_loads(response.content)
+        if 'message' in datalist[0]:
+            #e.g. an indicator not in WB_SOURCE_ID: nothing found, the caller loads one by one
+            instrument.log('wb batch rejected', message=datalist[0]['message'])
+            return {}
+        pages = int(datalist[0].get('pages') or 1)
+        if (len(datalist) > 1) and (datalist[1] is not None): records += datalist[1]
+        page += 1
+
+    with instrument.stage('parse', source="WORLD BANK", rows=len(records)):
+        by_indicator = {}
+        for record in records:
+            by_indicator.setdefault(record['indicator']['id'], []).append(record)
+        return {url_code: parse_wb_records(group) for url_code, group in by_indicator.items()}
+
+#-----------------------------------------------------------------
+# Canonical dtypes shared by all the loaders: codes and dimensions as
+# categories, Year as int16 and Value as float32
+#-----------------------------------------------------------------
+def normalize_frame (df):
+    df = df.reset_index(drop=True)
+
+    for col in df.columns:
+        if col == 'Year':
+            year = pd.to_numeric(df[col])
+            df[col] = year.astype('int16') if year.notna().all() else year.astype('Int16')
+        elif col == 'Value':
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float32')
+        elif (df[col].dtype == object) or (pd.api.types.is_string_dtype(df[col]) and not isinstance(df[col].dtype, pd.CategoricalDtype)):
+            df[col] = df[col].astype('category')
+    return df
+
+def frame_memory (df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+def memory_report (meta):
+    m = meta.get('memory')
+    if not m: return ''
+    return "%d rows, %.1f kB -> %.1f kB" % (m['rows'], m['bytes_before'] / 1024, m['bytes_after'] / 1024)
+
+def get_wb_data(url):
+    # Fetch data from the World Bank API in JSON format
+    response = transport.get(url)
+
+    with instrument.stage('parse', source="WORLD BANK", bytes=len(response.content)) as info:
+        datalist = json_loads(response.content)
+        gdp_df, meta = parse_wb_payload(datalist)
+        info['rows'] = len(gdp_df)
+    return gdp_df, meta
+
+def parse_wb_payload(datalist):
+    records = datalist[1] if (len(datalist) > 1) and (datalist[1] is not None) else []
+    return parse_wb_records(records)
+
+def parse_wb_records(records):
+    meta = new_meta()
+
+    # Extract relevant data column-wise: from_records builds the columns in one pass
+    df = pd.DataFrame.from_records(records, columns=['countryiso3code', 'date', 'value'])
+
+    gdp_df = pd.DataFrame({
+        'Country Code': df['countryiso3code'].astype(object),
+        'Year': pd.to_numeric(df['date']),
+        'Value': pd.to_numeric(df['value'])
+    })
+    return gdp_df, meta
+
+def eurostat_filter_pars (url_code, geo=None, start_year=None, end_year=None, dim_filters=None):
+    import eurostat
+    filter_pars = {}
+
+    if geo is not None:
+        #asking only for the countries the dataset actually has, unknown codes are rejected by the API
+        available = set(eurostat.get_par_values(url_code, 'geo'))
+        filter_pars['geo'] = [g for g in geo if g in available]
+    if start_year is not None: filter_pars['startPeriod'] = int(start_year)
+    if end_year is not None: filter_pars['endPeriod'] = int(end_year)
+
+    for key, values in (dim_filters or {}).items():
+        filter_pars[key] = list(values) if isinstance(values, (list, tuple)) else [values]
+    return filter_pars
+
+def get_data_from_eurostat (url_code, geo=None, start_year=None, end_year=None, dim_filters=None):
+    import eurostat
+
+    #getting dimensions and data as pandas df, only for the requested countries/years/dimension values
+    filter_pars = eurostat_filter_pars(url_code, geo, start_year, end_year, dim_filters)
+    if ('geo' in filter_pars) and (len(filter_pars['geo']) == 0):
+        df = None
+    else:
+        with instrument.stage('fetch', source="EUROSTAT", code=url_code) as info:
+            df = eurostat.get_data_df(url_code, filter_pars=filter_pars)
+            info['rows'] = 0 if df is None else len(df)
+
+    with instrument.stage('parse', source="EUROSTAT", code=url_code) as info:
+        gdp_df, meta = parse_eurostat_frame(df)
+        info['rows'] = len(gdp_df)
+    return gdp_df, meta
+
+def parse_eurostat_frame(df):
+    #wide frame of eurostat.get_data_df (dimensions, geo, one column per period) to long format
+    meta = new_meta()
+    if df is None:
+        return pd.DataFrame(columns=['Country Code', 'Year', 'Value']), meta
+
+    cols = list(df.columns)
+
+    #the geo column separates the dimensions from the time periods
+    geo_col = [i for i in cols if i[:3] == 'geo'][0]
+    geo_pos = cols.index(geo_col)
+
+    #setting up filter string for unpivoting
+    vars_string = []
+    unpivot_string = cols[geo_pos+1:]
+
+    #defining vars to unpivot
+    for i in cols[:geo_pos]:
+        if (df[i].nunique() >1):
+            vars_string.append(i)
+            unique_values = df[i].unique()
+
+            if i == 'sex':
+                meta['sex_split'] = True
+            else:
+                meta['filter_list'][i] = unique_values.tolist()
+    vars_string.append(geo_col)
+
+    gdp_df = pd.melt (df, id_vars = vars_string, value_vars= unpivot_string, var_name='Year', value_name="Value")
+    gdp_df = gdp_df.dropna(subset=['Value'])
+    gdp_df = gdp_df.rename (columns = {geo_col : 'Country Code'})
+    gdp_df['Year'] = pd.to_numeric(gdp_df['Year'])
+    return gdp_df, meta
+
+def get_data_from_whoeurope (url_code):
+    response = transport.get(url_code, headers=HEADERS)
+
+    with instrument.stage('parse', source="WHO/Europe", bytes=len(response.content)) as info:
+        dt = json_loads(response.content)
+        gdp_df, meta = parse_whoeurope_payload(dt)
+        info['rows'] = len(gdp_df)
+    return gdp_df, meta
+
+def parse_whoeurope_payload(dt):
+    return parse_whoeurope_measure(dt[0])
+
+def parse_whoeurope_measure(measure):
+    meta = new_meta()
+
+    dim = [i['code'] for i in measure['dimensions']]
+    sex_split = ("SEX" in dim)
+    keys = ['COUNTRY', 'YEAR', 'SEX'] if sex_split else ['COUNTRY', 'YEAR']
+
+    #batch column extraction: one frame from the dimension dicts, one column for the values
+    data = measure['data']
+    df = pd.DataFrame.from_records([entry['dimensions'] for entry in data], columns=keys)
+    df = df.rename(columns={'COUNTRY': 'Country Code', 'YEAR': 'Year', 'SEX': 'sex'})
+    df.insert(2, 'Value', pd.to_numeric(pd.Series([entry['value']['numeric'] for entry in data], dtype=object)))
+
+    #check whether dataset has disaggregation by sex
+    if (sex_split):
+        if (df['sex'].nunique() < 2): sex_split = False
+    meta['sex_split'] = sex_split
+
+    df_cleaned = df[ df['Country Code'] != '']
+    gdp_df = df_cleaned.sort_values(by=['Country Code', 'Year'])
+    gdp_df['Year'] = pd.to_numeric(gdp_df['Year'])
+    return gdp_df, meta
+
+def get_data_from_OECD (url_code):
+    response = transport.get(url_code, headers=HEADERS)
+    instrument.log('oecd response', status=response.status_code)
+    return parse_oecd_payload(response.json())
+
+def parse_oecd_payload(dt):
+    meta = new_meta()
+
+    sex_split = False
+    df_string = {}
+    years = []
+    values = []
+    country_codes = []
+    sex = []
+    dim = []
+
+    for i in (dt[0]['SeriesKey']):
+        dim.append(i['REF_AREA'])
+
+    for entry in dt[0]['data']:
+        years.append(entry['dimensions']['YEAR'])
+        values.append(entry['value']['numeric'])
+        country_codes.append(entry['dimensions']['COUNTRY'])
+        df_string = {'Country Code': country_codes, 'Year': years, 'Value': values}
+
+        if (sex_split):
+            sex.append(entry['dimensions']['SEX'])
+            df_string.update ({'sex': sex})
+
+    # Convert to DataFrame
+    df = pd.DataFrame(df_string)
+
+    if (sex_split):
+        if (df['sex'].nunique() < 2): sex_split = False
+    meta['sex_split'] = sex_split
+
+    df_cleaned = df[ df['Country Code'] != '']
+    gdp_df = df_cleaned.sort_values(by=['Country Code', 'Year'])
+    gdp_df['Year'] = pd.to_numeric(gdp_df['Year'])
+    return gdp_df, meta
+
+def hesr_filename (source):
+    if (source== "WHO/HESRI"): return Path(__file__).parent/'data/HESR1.xlsx'
+    return Path(__file__).parent/'data/HESR2.xlsx'
+
+def get_data_from_WHOHESR (url_code, source):
+    #reading only the rows of the indicator from the columnar store (see hesr_store.py)
+    with instrument.stage('fetch', source=source, code=url_code) as info:
+        df = hesr_store.load_indicator(hesr_filename(source), url_code)
+        info['rows'] = len(df)
+
+    with instrument.stage('parse', source=source, code=url_code) as info:
+        gdp_df, meta = parse_hesr_frame(df, source)
+        info['rows'] = len(gdp_df)
+    return gdp_df, meta
+
+def load_hesr_latest (source, url_code):
+    #latest year of every dimension, sex, country and level, precomputed by the HESR store; None if unknown
+    with instrument.stage('fetch', source=source, code=url_code, view='latest') as info:
+        df = hesr_store.load_latest(hesr_filename(source), url_code)
+        info['rows'] = 0 if df is None else len(df)
+    if df is None: return None
+    return normalize_frame(df)
+
+def parse_hesr_frame (df, source):
+    meta = new_meta()
+    filter_list = meta['filter_list']
+
+    not_unique_col = []
+    vars_string = []
+
+    cols = list(df.columns)
+
+    for i in cols:
+        if (df[i].nunique()>1): not_unique_col.append(i)
+
+    for i in not_unique_col:
+        vars_string.append(i)
+        unique_values = df[i].unique()
+
+        if i == 'sex':
+            meta['sex_split'] = True
+        else:
+            filter_list[i] = unique_values.tolist()
+
+    #lighten the dataframe
+    keys_to_remove = ['Country Code', 'Year', 'Value', 'population']
+    if (source == 'WHO/HESRI 2'): keys_to_remove += ['Education', 'Income']
+    for key in keys_to_remove:
+        if key in filter_list: del filter_list[key]
+
+    df_cleaned = df.dropna()
+    instrument.log('hesr dimensions', filter_list=filter_list)
+    return df_cleaned, meta
@@ -0,0 +1,79 @@
+import os
+
+import pandas as pd
+
+import instrument
+
+#-----------------------------------------------------------------
+# Compact data for the AI prompt
+#
+# The prompt gets the statistical summary of every indicator (summary.py)
+# instead of its tables. When the text is over the token budget the last
+# indicators in catalog order are left out, so the cut is deterministic.
+# The report compares its size with the plain tables (to_string) and with
+# the tables in the compact '|' delimited layout of encode_table(): only
+# the years with data, rounded values, empty cells for missing years.
+#-----------------------------------------------------------------
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get('WELLBEING_PROMPT_TOKENS', 6000))
+SEPARATOR = '|'
+
+_encoding = []
+
+
+def count_tokens(text):
+    #tiktoken, imported at the first count, gives the exact token count of the model; without it the count is estimated
+    if not _encoding:
+        try:
+            import tiktoken
+            _encoding.append(tiktoken.get_encoding('o200k_base'))
+        except Exception:
+            _encoding.append(None)
+    if _encoding[0] is None: return (len(text) + 3) // 4
+    return len(_encoding[0].encode(text))
+
+
+def compact_number(value):
+    #3-4 significant digits, no padding and no trailing zeros; '' for None and NaN of any float type (e.g. float32)
+    if pd.isna(value): return ''
+    if 0 < abs(value) < 1: return '%.2g' % value
+    digits = 0 if abs(value) >= 100 else 1 if abs(value) >= 10 else 2
+    text = ('%.' + str(digits) + 'f') % value
+    if '.' in text: text = text.rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+
+def encode_table(title, pivot_data):
+    #pivot_data: dimensions as index, years as columns
+    table = pivot_data.dropna(axis=1, how='all').dropna(axis=0, how='all')
+
+    names = [str(name) for name in table.index.names]
+    lines = ['## ' + title, SEPARATOR.join(names + [str(int(year)) for year in table.columns])]
+    for keys, values in zip(table.index, table.to_numpy()):
+        keys = keys if isinstance(keys, tuple) else (keys,)
+        lines.append(SEPARATOR.join([str(key) for key in keys] + [compact_number(value) for value in values]))
+    return '\n'.join(lines)
+
+
+def data_prompt(tables, blocks, budget=PROMPT_TOKEN_BUDGET):
+    #tables: [(title, pivot_data)], only measured; blocks: [(title, text)] sent in their place
+    #(both in catalog order); returns (text, report)
+    with instrument.stage('prompt', tables=len(tables)) as info:
+        legacy = ''.join("\n" + title + "\n" + pivot_data.to_string() for title, pivot_data in tables)
+        report = {'tokens_before': count_tokens(legacy),
+                  'tokens_tables': count_tokens('\n'.join(encode_table(title, pivot_data) for title, pivot_data in tables)),
+                  'budget': budget, 'dropped': 0}
+
+        header = "\nData summary, one block per indicator, values separated by '" + SEPARATOR + "', trend = slope per year:\n"
+        texts = [text for title, text in blocks]
+        text = header + '\n'.join(texts)
+        tokens = count_tokens(text)
+        while texts and tokens > budget:
+            texts.pop()
+            report['dropped'] += 1
+            text = header + '\n'.join(texts) + '\n[%d more indicators omitted]' % report['dropped']
+            tokens = count_tokens(text)
+
+        report['tokens_after'] = tokens
+        info.update(tokens_before=report['tokens_before'], tokens_after=tokens, bytes=len(text))
+    return text, report
@@ -0,0 +1,99 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import instrument
+
+#-----------------------------------------------------------------
+# Indexed queries over an indicator frame (Explore view)
+#
+#   index = query.IndicatorIndex(gdp_df)
+#   parts = index.select(iso_acronyms, from_year, to_year, {'unit': 'PC'}, split_sex=True)
+#   parts['F'], parts['M']          (parts['all'] without split_sex)
+#
+# The frame is sorted once by country and year, so the rows of a country
+# are one slice and a year range inside it two binary searches. The
+# dimension columns are factorized to integer codes at their first use and
+# the sex values grouped into F (F, FEMALE) and M (M, MALE). A query then
+# collects the row positions of the countries and years, checks the
+# dimension values on those positions only and gathers every sex group
+# with one take(), instead of a boolean mask and a copy of the frame per
+# condition. The index is built once per cached indicator (main.py).
+#-----------------------------------------------------------------
+
+FEMALE_VALUES = ('F', 'FEMALE')
+MALE_VALUES = ('M', 'MALE')
+_OTHER, _FEMALE, _MALE = 0, 1, 2
+_MISSING = -2  #code of a value not found in a dimension (factorize uses -1 for NaN)
+
+
+class IndicatorIndex:
+    def __init__(self, gdp_df):
+        with instrument.stage('filter index', rows=len(gdp_df)):
+            frame = gdp_df.sort_values(['Country Code', 'Year'], kind='stable')
+            self.frame = frame
+            self.years = frame['Year'].to_numpy(dtype='float64')
+
+            codes = frame['Country Code'].to_numpy()
+            bounds = np.flatnonzero(codes[1:] != codes[:-1]) + 1 if len(codes) else np.empty(0, dtype=np.intp)
+            starts = np.r_[0, bounds] if len(codes) else bounds
+            stops = np.r_[bounds, len(codes)] if len(codes) else bounds
+            self.countries = {codes[start]: (start, stop) for start, stop in zip(starts, stops)}
+
+            if 'sex' in frame.columns:
+                sex = frame['sex']
+                self.sex = np.where(sex.isin(FEMALE_VALUES), _FEMALE, np.where(sex.isin(MALE_VALUES), _MALE, _OTHER)).astype('int8')
+            else:
+                self.sex = None
+
+        self._dimensions = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.frame)
+
+    def dimension(self, col):
+        #(integer code per row, {value: code}), computed at the first query on the column
+        with self._lock:
+            found = self._dimensions.get(col)
+        if found is None:
+            codes, uniques = pd.factorize(self.frame[col])
+            found = (codes, {value: code for code, value in enumerate(uniques)})
+            with self._lock:
+                self._dimensions[col] = found
+        return found
+
+    def positions(self, countries, from_year, to_year):
+        #row positions of the countries (in the order given) between the two years, both included
+        parts = []
+        for code in dict.fromkeys(countries):
+            span = self.countries.get(code)
+            if span is None: continue
+            start, stop = span
+            years = self.years[start:stop]
+            low = start + np.searchsorted(years, from_year, side='left')
+            high = start + np.searchsorted(years, to_year, side='right')
+            if high > low: parts.append(np.arange(low, high))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.intp)
+
+    def select(self, countries, from_year, to_year, filters=None, split_sex=False):
+        #{'all': frame} or, with split_sex, {'F': frame, 'M': frame}
+        with instrument.stage('filter', rows=len(self.frame)) as info:
+            pos = self.positions(countries, from_year, to_year)
+            info['rows_range'] = len(pos)
+
+            if filters and len(pos):
+                keep = np.ones(len(pos), dtype=bool)
+                for col, value in filters.items():
+                    codes, lookup = self.dimension(col)
+                    keep &= codes[pos] == lookup.get(value, _MISSING)
+                pos = pos[keep]
+
+            if split_sex:
+                sex = self.sex[pos] if self.sex is not None else np.zeros(len(pos), dtype='int8')
+                parts = {'F': self.frame.take(pos[sex == _FEMALE]), 'M': self.frame.take(pos[sex == _MALE])}
+            else:
+                parts = {'all': self.frame.take(pos)}
+            info['rows_out'] = sum(len(part) for part in parts.values())
+        return parts
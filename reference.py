@@ -0,0 +1,67 @@
+import os
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+#-----------------------------------------------------------------
+# Reference tables: the indicator catalog and the WHO/Europe countries
+#
+# Read once per process and kept in memory; a Parquet copy in
+# data/.cache/reference/ spares the Excel parsing (xlrd, openpyxl) at the
+# next start. Both are keyed by the mtime and size of the workbook, so an
+# edited file is picked up at the next call. indicators() and countries()
+# return a copy; load_table() returns the shared frame, not to be modified.
+#-----------------------------------------------------------------
+
+DATA_DIR = Path(__file__).parent/'data'
+CACHE_DIR = DATA_DIR/'.cache/reference'
+INDICATORS = DATA_DIR/'Indicators.xlsx'
+COUNTRIES = DATA_DIR/'countries_WHO_Euro.xls'
+
+_tables = {}
+_lock = threading.Lock()
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_table(path):
+    #the frame of the workbook, shared by all the callers: do not modify it (or copy it first)
+    stamp = _stamp(path)
+    with _lock:
+        cached = _tables.get(path)
+    if (cached is not None) and (cached[0] == stamp): return cached[1]
+
+    cache_file = CACHE_DIR/('%s-%d-%d.parquet' % (path.stem, stamp[0], stamp[1]))
+    try:
+        df = pd.read_parquet(cache_file)
+    except Exception:
+        df = pd.read_excel(path)
+        _write_cache(path, cache_file, df)
+
+    with _lock:
+        _tables[path] = (stamp, df)
+    return df
+
+
+def _write_cache(path, cache_file, df):
+    #best effort: a workbook with mixed-type columns stays in memory only
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        for old in CACHE_DIR.glob(path.stem + '-*.parquet'): old.unlink()
+        tmp = cache_file.with_name(cache_file.name + '.tmp' + str(os.getpid()))
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, cache_file)
+    except Exception:
+        pass
+
+
+def indicators():
+    return load_table(INDICATORS).copy()
+
+
+def countries():
+    return load_table(COUNTRIES).copy()
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+
+import hesr_store
+import instrument
+import loaders
+import transport
+
+#-----------------------------------------------------------------
+# Conditional refresh of the indicators
+#
+# Every loaded indicator keeps validators in meta['validators']: ETag,
+# Last-Modified and a hash of the body for the HTTP sources, the source's own
+# update date where the API has one (World Bank 'lastupdated', Eurostat
+# table of contents) and the workbook stamp for HESR. fetch_if_changed()
+# revalidates with them and downloads/parses again only when the data did
+# change. load_indicator() keeps a local copy of every indicator in
+# data/.cache/indicators/ and revalidates it once it is older than max_age;
+# when the source cannot be reached the stale copy is served.
+#-----------------------------------------------------------------
+
+CACHE_DIR = Path(__file__).parent/'data/.cache/indicators'
+REVALIDATE_AFTER = 6 * 3600
+EUROSTAT_TOC_TTL = 3600
+
+_eurostat_toc = {'loaded': 0, 'dates': {}}
+
+
+def http_validators(response):
+    return {'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'sha256': hashlib.sha256(response.content).hexdigest()}
+
+
+def conditional_headers(validators, headers=None):
+    headers = dict(headers or {})
+    if validators.get('etag'): headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'): headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+def wb_last_updated(url_a):
+    #one-row page: the header carries the update date of the whole source
+    response = transport.get(url_a.replace('per_page=20000', 'per_page=1'))
+    header = loaders.json_loads(response.content)[0]
+    return header.get('lastupdated')
+
+
+def eurostat_last_update(url_code):
+    import eurostat
+    if time.time() - _eurostat_toc['loaded'] > EUROSTAT_TOC_TTL:
+        toc = eurostat.get_toc_df()
+        _eurostat_toc['dates'] = dict(zip(toc['code'], toc['last update of data'].astype(str)))
+        _eurostat_toc['loaded'] = time.time()
+    return _eurostat_toc['dates'].get(url_code)
+
+
+def fetch_if_changed(source, url_code, validators=None):
+    #returns ('unchanged', validators, None) or ('changed', validators, (gdp_df, meta));
+    #without validators the indicator is always downloaded
+    previous = validators or {}
+    url_a, url_b = loaders.indicator_urls(source, url_code)
+
+    match source:
+        case "WORLD BANK" | "WHO/Europe":
+            new = {}
+            if source == "WORLD BANK":
+                new['lastupdated'] = wb_last_updated(url_a)
+                if previous and new['lastupdated'] and (new['lastupdated'] == previous.get('lastupdated')):
+                    return 'unchanged', previous, None
+
+            headers = None if source == "WORLD BANK" else loaders.HEADERS
+            response = transport.get(url_a, headers=conditional_headers(previous, headers))
+            if response.status_code == 304:
+                return 'unchanged', previous, None
+
+            new.update(http_validators(response))
+            if previous and (new['sha256'] == previous.get('sha256')):
+                return 'unchanged', new, None
+
+            parse = loaders.parse_wb_payload if source == "WORLD BANK" else loaders.parse_whoeurope_payload
+            with instrument.stage('parse', source=source, code=url_code, bytes=len(response.content)) as info:
+                gdp_df, meta = parse(loaders.json_loads(response.content))
+                info['rows'] = len(gdp_df)
+            return 'changed', new, loaders.finish_indicator(source, url_code, gdp_df, meta)
+
+        case "EUROSTAT":
+            new = {'last_update': eurostat_last_update(url_code)}
+            if previous and new['last_update'] and (new['last_update'] == previous.get('last_update')):
+                return 'unchanged', previous, None
+            return 'changed', new, loaders.load_indicator(source, url_code)
+
+        case "WHO/HESRI" | "WHO/HESRI 2":
+            stamp = hesr_store.source_stamp(loaders.hesr_filename(source))
+            new = {'mtime_ns': stamp['mtime_ns'], 'size': stamp['size']}
+            if previous and (new == {k: previous.get(k) for k in new}):
+                return 'unchanged', previous, None
+            return 'changed', new, loaders.load_indicator(source, url_code)
+
+    #no validators for this source: full download
+    return 'changed', {}, loaders.load_indicator(source, url_code)
+
+
+def _entry_path(source, url_code):
+    return CACHE_DIR/hashlib.sha1((str(source) + '|' + str(url_code)).encode()).hexdigest()[:16]
+
+
+def cached_entry(source, url_code):
+    #metadata and check time of the local copy, without reading its data; None if there is none
+    try:
+        with open(_entry_path(source, url_code).with_suffix('.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_fresh(source, url_code, max_age=REVALIDATE_AFTER):
+    entry = cached_entry(source, url_code)
+    return (entry is not None) and (time.time() - entry['checked'] < max_age)
+
+
+def _read_entry(source, url_code):
+    entry = cached_entry(source, url_code)
+    if entry is None: return None
+    try:
+        return pd.read_parquet(_entry_path(source, url_code).with_suffix('.parquet')), entry
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, entry):
+    tmp = path.with_suffix('.json.tmp' + str(os.getpid()))
+    with open(tmp, 'w') as f:
+        json.dump(entry, f, default=str)
+    os.replace(tmp, path.with_suffix('.json'))
+
+
+def store_indicator(source, url_code, gdp_df, meta, validators=None):
+    #local copy of a freshly loaded indicator; without validators it is downloaded again once stale.
+    #'content' is the hash of its Parquet file: the data version when the source has no validators
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _entry_path(source, url_code)
+    meta['validators'] = validators or {}
+    tmp = path.with_suffix('.parquet.tmp' + str(os.getpid()))
+    gdp_df.to_parquet(tmp, index=False)
+    content = hashlib.sha256(tmp.read_bytes()).hexdigest()
+    os.replace(tmp, path.with_suffix('.parquet'))
+    _write_json(path, {'source': source, 'code': url_code, 'checked': time.time(), 'content': content, 'meta': meta})
+
+
+def load_indicator(source, url_code, max_age=REVALIDATE_AFTER):
+    #(gdp_df, meta) from the local copy, revalidated against the source when older than max_age
+    cached = _read_entry(source, url_code)
+    if (cached is not None) and (time.time() - cached[1]['checked'] < max_age):
+        return cached[0], cached[1]['meta']
+
+    validators = cached[1]['meta'].get('validators') if cached is not None else None
+    try:
+        status, validators, result = fetch_if_changed(source, url_code, validators)
+    except Exception as e:
+        if cached is None: raise
+        #source down or timed out: the stale copy stands, revalidated again at the next call
+        instrument.log('revalidation failed', level=logging.WARNING, source=source, code=url_code, error=repr(e))
+        return cached[0], cached[1]['meta']
+
+    if (status == 'unchanged') and (cached is not None):
+        #not modified: only the check time and the validators are updated, nothing is parsed
+        gdp_df, entry = cached
+        entry['meta']['validators'] = validators
+        entry['checked'] = time.time()
+        _write_json(_entry_path(source, url_code), entry)
+        instrument.log('not modified', source=source, code=url_code)
+        return gdp_df, entry['meta']
+
+    if result is None:
+        #validators matched but the local copy is gone
+        result = loaders.load_indicator(source, url_code)
+
+    gdp_df, meta = result
+    store_indicator(source, url_code, gdp_df, meta, validators)
+    return gdp_df, meta
@@ -0,0 +1,106 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import instrument
+
+#-----------------------------------------------------------------
+# PNG rendering of the Country Profile charts for the Word export
+#
+# Vega-Lite specs (chart.to_json(), data inlined) are rasterized with
+# vl-convert in a process pool, so all the charts of a profile render in
+# parallel. Every image is cached on disk by the hash of its spec: the same
+# chart with the same data is never rendered twice. The cache drops the
+# images not used for PNG_CACHE_MAX_AGE, then the least recently used ones
+# above PNG_CACHE_MAX_BYTES.
+#-----------------------------------------------------------------
+
+PNG_CACHE_DIR = Path(__file__).parent/'data/.cache/png'
+PNG_CACHE_MAX_BYTES = int(os.environ.get('WELLBEING_PNG_CACHE_MB', 200)) * 2**20
+PNG_CACHE_MAX_AGE = 30 * 24 * 3600
+PNG_SCALE = 2
+MAX_RENDER_WORKERS = max(1, min(4, (os.cpu_count() or 1)))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    #one pool per process; 'spawn' because the Streamlit server is multi-threaded
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=MAX_RENDER_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def spec_key(spec_json):
+    return hashlib.sha256(spec_json.encode()).hexdigest()
+
+
+def render_png(spec_json, scale=PNG_SCALE):
+    import vl_convert as vlc
+    return vlc.vegalite_to_png(vl_spec=spec_json, scale=scale)
+
+
+def render_pngs(specs):
+    #returns the PNG bytes of each spec, in the same order
+    with instrument.stage('png', charts=len(specs)) as info:
+        info['cached'] = sum(1 for spec_json in specs if (PNG_CACHE_DIR/(spec_key(spec_json) + '.png')).exists())
+        pngs = _render_pngs(specs)
+        info['bytes'] = sum(len(png) for png in pngs)
+    return pngs
+
+
+def _render_pngs(specs):
+    PNG_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    pngs = [None] * len(specs)
+    missing = []
+
+    for i, spec_json in enumerate(specs):
+        path = PNG_CACHE_DIR/(spec_key(spec_json) + '.png')
+        try:
+            pngs[i] = path.read_bytes()
+            os.utime(path)  #last use, for prune_cache
+        except OSError:
+            missing.append(i)
+
+    if len(missing) == 1:
+        #not worth a round trip to the pool
+        rendered = [render_png(specs[missing[0]])]
+    elif missing:
+        rendered = get_pool().map(render_png, [specs[i] for i in missing])
+    else:
+        rendered = []
+
+    for i, png in zip(missing, rendered):
+        path = PNG_CACHE_DIR/(spec_key(specs[i]) + '.png')
+        tmp = path.with_suffix('.tmp%d-%d' % (os.getpid(), threading.get_ident()))
+        tmp.write_bytes(png)
+        os.replace(tmp, path)
+        pngs[i] = png
+
+    if missing: prune_cache()
+    return pngs
+
+
+def prune_cache(max_bytes=PNG_CACHE_MAX_BYTES, max_age=PNG_CACHE_MAX_AGE):
+    #removes the images unused for max_age, then the least recently used ones until the cache fits max_bytes
+    files = []
+    for path in PNG_CACHE_DIR.glob('*.png'):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+
+    now = time.time()
+    total = sum(size for mtime, size, path in files)
+    for mtime, size, path in sorted(files):
+        if (now - mtime < max_age) and (total <= max_bytes): break
+        path.unlink(missing_ok=True)
+        total -= size
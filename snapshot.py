@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+#-----------------------------------------------------------------
+# Versioned local snapshot of every catalog indicator
+#
+# data/snapshots/<version>/ holds one Parquet file per (source, indicator)
+# with the normalized long-format frame, and a manifest.json with the
+# dimension metadata of each indicator. data/snapshots/CURRENT names the
+# version served by main.py and chart.py. Snapshots are written by warmup.py.
+#-----------------------------------------------------------------
+
+SNAPSHOT_DIR = Path(__file__).parent/'data/snapshots'
+CURRENT = 'CURRENT'
+MANIFEST = 'manifest.json'
+
+_manifests = {}
+
+
+def indicator_key(source, url_code):
+    return str(source) + '|' + str(url_code)
+
+
+def _file_name(source, url_code):
+    return hashlib.sha1(indicator_key(source, url_code).encode()).hexdigest()[:16] + '.parquet'
+
+
+def current_version():
+    try:
+        return (SNAPSHOT_DIR/CURRENT).read_text().strip() or None
+    except OSError:
+        return None
+
+
+def read_manifest(version):
+    if version not in _manifests:
+        with open(SNAPSHOT_DIR/version/MANIFEST) as f:
+            _manifests[version] = json.load(f)
+    return _manifests[version]
+
+
+def load_indicator(source, url_code, version=None):
+    #returns (df, meta) from the snapshot, or None when the indicator is not in it
+    version = version or current_version()
+    if version is None: return None
+
+    try:
+        manifest = read_manifest(version)
+    except (OSError, ValueError):
+        return None
+
+    entry = manifest['indicators'].get(indicator_key(source, url_code))
+    if (entry is None) or ('file' not in entry): return None
+
+    df = pd.read_parquet(SNAPSHOT_DIR/version/entry['file'])
+    return df, entry['meta']
+
+
+def load_indicator_meta(source, url_code, version=None):
+    #metadata (with the refresh validators) of an indicator of the snapshot, without reading its data
+    version = version or current_version()
+    if version is None: return None
+    try:
+        entry = read_manifest(version)['indicators'].get(indicator_key(source, url_code))
+    except (OSError, ValueError):
+        return None
+    if (entry is None) or ('file' not in entry): return None
+    return entry['meta']
+
+
+def new_snapshot(version=None):
+    #a new version is written in <version>.tmp and becomes CURRENT on commit_snapshot()
+    version = version or datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    path = SNAPSHOT_DIR/(version + '.tmp')
+    shutil.rmtree(path, ignore_errors=True)
+    path.mkdir(parents=True)
+    manifest = {'version': version, 'created': datetime.now(timezone.utc).isoformat(), 'indicators': {}}
+    return {'version': version, 'path': path, 'manifest': manifest}
+
+
+def add_indicator(snap, source, url_code, df, meta):
+    file_name = _file_name(source, url_code)
+    df.reset_index(drop=True).to_parquet(snap['path']/file_name, index=False)
+    snap['manifest']['indicators'][indicator_key(source, url_code)] = {
+        'source': source, 'code': url_code, 'file': file_name, 'rows': len(df), 'meta': meta}
+
+
+def keep_indicator(snap, source, url_code, meta, version=None):
+    #unchanged upstream: the file of the CURRENT version is copied as is, nothing is parsed
+    version = version or current_version()
+    entry = dict(read_manifest(version)['indicators'][indicator_key(source, url_code)])
+    shutil.copyfile(SNAPSHOT_DIR/version/entry['file'], snap['path']/entry['file'])
+    entry['meta'] = meta
+    snap['manifest']['indicators'][indicator_key(source, url_code)] = entry
+
+
+def add_error(snap, source, url_code, error):
+    snap['manifest']['indicators'][indicator_key(source, url_code)] = {
+        'source': source, 'code': url_code, 'error': str(error)}
+
+
+def carry_over(snap):
+    #copies from the CURRENT version the indicators the new snapshot does not have
+    version = current_version()
+    if version is None: return 0
+
+    copied = 0
+    for key, entry in read_manifest(version)['indicators'].items():
+        if (key in snap['manifest']['indicators']) or ('file' not in entry): continue
+        shutil.copyfile(SNAPSHOT_DIR/version/entry['file'], snap['path']/entry['file'])
+        snap['manifest']['indicators'][key] = entry
+        copied += 1
+    return copied
+
+
+def commit_snapshot(snap):
+    with open(snap['path']/MANIFEST, 'w') as f:
+        json.dump(snap['manifest'], f, indent=1, default=str)
+
+    final = SNAPSHOT_DIR/snap['version']
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(snap['path'], final)
+
+    #switching CURRENT atomically, readers see either the old or the new version
+    tmp = SNAPSHOT_DIR/(CURRENT + '.tmp')
+    tmp.write_text(snap['version'])
+    os.replace(tmp, SNAPSHOT_DIR/CURRENT)
+    return final
+
+
+def prune(keep):
+    #removes all but the latest `keep` versions, never the CURRENT one
+    current = current_version()
+    versions = sorted(p.name for p in SNAPSHOT_DIR.iterdir() if p.is_dir() and not p.name.endswith('.tmp'))
+    for version in versions[:-keep] if keep > 0 else versions:
+        if version != current: shutil.rmtree(SNAPSHOT_DIR/version, ignore_errors=True)
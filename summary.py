@@ -0,0 +1,185 @@
+import pandas as pd
+
+import instrument
+from prompt import compact_number
+
+#-----------------------------------------------------------------
+# Statistical summary of the profile indicators
+#
+# The long frames of all the indicators of a profile are stacked into one
+# frame (indicator, sex, series, stratifier, level, Year, Value) and every
+# figure is computed with grouped operations over all of them at once:
+#   series     latest year and value, trend slope and change over the last
+#              TREND_YEARS years, per indicator and dimension values
+#   gaps       male - female difference in the latest year with both
+#   gradients  HESR stratifiers: highest minus lowest education/income
+#              level in the latest year (and their ratio)
+# summary_blocks() writes them as short text, one block per indicator,
+# for the AI prompt in place of the full tables.
+#-----------------------------------------------------------------
+
+TREND_YEARS = 10
+SEX_CODES = {'M': 'M', 'MALE': 'M', 'MALES': 'M', 'MLE': 'M', 'F': 'F', 'FEMALE': 'F', 'FEMALES': 'F', 'FMLE': 'F'}
+
+#levels of the HESR stratifiers, from the lowest to the highest
+STRATIFIER_LEVELS = {
+    'Education': ['Low education', 'Medium education', 'High education'],
+    'Income': ['Income Q1 (lowest)', 'Income Q2', 'Income Q3', 'Income Q4', 'Income Q5 (highest)'],
+}
+LEVEL_STRATIFIER = {level: stratifier for stratifier, levels in STRATIFIER_LEVELS.items() for level in levels}
+LEVEL_RANK = {level: rank for levels in STRATIFIER_LEVELS.values() for rank, level in enumerate(levels)}
+STRATIFIER_VALUES = set(STRATIFIER_LEVELS) | {'All'}
+
+SERIES_KEYS = ['indicator', 'sex', 'series', 'stratifier', 'level']
+NOT_DIMENSIONS = ('Country Code', 'Year', 'Value', 'population')
+
+
+def _label(df, cols):
+    #"dim=value; dim=value" per row, '' without dimensions
+    if not cols: return pd.Series('', index=df.index)
+    label = cols[0] + '=' + df[cols[0]].astype(str)
+    for col in cols[1:]:
+        label = label + '; ' + col + '=' + df[col].astype(str)
+    return label
+
+
+def _is_label(col):
+    return isinstance(col.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(col.dtype) or (col.dtype == object)
+
+
+def _levels(dtc, level_cols):
+    #(level of every row, rows kept): a row of one stratifier has the other ones at 'All';
+    #the totals (all at 'All') are kept with no level, the crossings of two stratifiers are left out
+    level = pd.Series('', index=dtc.index, dtype=object)
+    values = {col: dtc[col].astype(str) for col in level_cols}
+    at_all = {col: values[col] == 'All' for col in level_cols}
+
+    keep = pd.Series(True, index=dtc.index)
+    for col in level_cols: keep &= at_all[col]
+    for col in level_cols:
+        rows = values[col].isin(LEVEL_RANK.keys())
+        for other in level_cols:
+            if other != col: rows &= at_all[other]
+        level = level.mask(rows, values[col])
+        keep |= rows
+    return level, keep
+
+
+def stack_indicators(tables):
+    #tables: [(indicator title, long frame of the country)] -> one long frame
+    frames = []
+    for title, dtc in tables:
+        #dimensions: the label columns with more than one value (not e.g. population or indicator_abbr)
+        dims = [dim for dim in dtc.columns if (dim not in NOT_DIMENSIONS) and _is_label(dtc[dim]) and (dtc[dim].nunique() > 1)]
+        #stratifier columns, e.g. Education and Income of HESR, each with its levels and 'All'
+        level_cols = [dim for dim in dims if dtc[dim].astype(str).isin(LEVEL_RANK.keys()).any()]
+        #columns naming the stratifier itself (e.g. dimension=Education) go with the level
+        strat_cols = [dim for dim in dims if (dim not in level_cols) and set(dtc[dim].astype(str).unique()) <= STRATIFIER_VALUES]
+        series_cols = [dim for dim in dims if dim not in ['sex'] + level_cols + strat_cols]
+
+        level, keep = _levels(dtc, level_cols)
+        dtc, level = dtc[keep], level[keep]
+        frame = pd.DataFrame({
+            'indicator': title,
+            'sex': dtc['sex'].astype(str).str.upper().map(SEX_CODES).fillna('T') if 'sex' in dtc.columns else 'T',
+            'series': _label(dtc, series_cols),
+            'stratifier': level.map(LEVEL_STRATIFIER).fillna(''),
+            'level': level,
+            'Year': pd.to_numeric(dtc['Year']).astype('int32'),
+            'Value': pd.to_numeric(dtc['Value']).astype('float64'),
+        })
+        frame['rank'] = frame['level'].map(LEVEL_RANK)
+        frames.append(frame)
+
+    if not frames: return pd.DataFrame(columns=SERIES_KEYS + ['rank', 'Year', 'Value'])
+    long = pd.concat(frames, ignore_index=True).dropna(subset=['Value'])
+    long[['stratifier', 'level']] = long[['stratifier', 'level']].fillna('')
+    return long
+
+
+def series_stats(long):
+    #latest value, OLS slope and change over the last TREND_YEARS years of every series
+    long = long.sort_values('Year', kind='stable')
+    groups = long.groupby(SERIES_KEYS, sort=False)
+
+    latest_year = groups['Year'].transform('max')
+    window = long[long['Year'] >= latest_year - TREND_YEARS].assign(
+        xy=lambda w: w['Year'] * w['Value'], xx=lambda w: w['Year'].astype('float64') ** 2)
+    w = window.groupby(SERIES_KEYS, sort=False).agg(
+        n=('Value', 'size'), sx=('Year', 'sum'), sy=('Value', 'sum'), sxx=('xx', 'sum'), sxy=('xy', 'sum'),
+        first_year=('Year', 'first'), first_value=('Value', 'first'),
+        latest_year=('Year', 'last'), latest_value=('Value', 'last'))
+
+    denominator = w['n'] * w['sxx'] - w['sx'] ** 2
+    w['slope'] = ((w['n'] * w['sxy'] - w['sx'] * w['sy']) / denominator).where(denominator != 0)
+    w['change'] = (w['latest_value'] - w['first_value']).where(w['n'] > 1)
+    return w[['latest_year', 'latest_value', 'first_year', 'first_value', 'change', 'slope', 'n']].reset_index()
+
+
+def sex_gaps(long):
+    #male - female in the latest year with both values, per indicator and series
+    keys = ['indicator', 'series', 'stratifier', 'level']
+    mf = long[long['sex'].isin(['M', 'F'])]
+    if mf.empty: return pd.DataFrame(columns=keys + ['Year', 'M', 'F', 'gap'])
+
+    both = mf.pivot_table(index=keys + ['Year'], columns='sex', values='Value', aggfunc='mean').dropna()
+    if both.empty or not {'M', 'F'} <= set(both.columns): return pd.DataFrame(columns=keys + ['Year', 'M', 'F', 'gap'])
+    both = both.reset_index().sort_values('Year', kind='stable').groupby(keys, sort=False).tail(1)
+    both['gap'] = both['M'] - both['F']
+    return both[keys + ['Year', 'M', 'F', 'gap']].reset_index(drop=True)
+
+
+def gradients(long):
+    #highest minus lowest level of each stratifier, in the latest year with at least two levels
+    keys = ['indicator', 'sex', 'series', 'stratifier']
+    strat = long[long['stratifier'] != '']
+    if strat.empty: return pd.DataFrame(columns=keys + ['Year', 'low_level', 'low', 'high_level', 'high', 'gradient', 'ratio'])
+
+    by_year = strat.sort_values('rank', kind='stable').groupby(keys + ['Year'], sort=False).agg(
+        levels=('rank', 'size'), low_level=('level', 'first'), low=('Value', 'first'),
+        high_level=('level', 'last'), high=('Value', 'last')).reset_index()
+    by_year = by_year[by_year['levels'] > 1].sort_values('Year', kind='stable').groupby(keys, sort=False).tail(1)
+    by_year['gradient'] = by_year['high'] - by_year['low']
+    by_year['ratio'] = (by_year['high'] / by_year['low']).where(by_year['low'] != 0)
+    return by_year[keys + ['Year', 'low_level', 'low', 'high_level', 'high', 'gradient', 'ratio']].reset_index(drop=True)
+
+
+def summarize(tables):
+    #tables: [(indicator title, long frame)] -> {'series': ..., 'gaps': ..., 'gradients': ...}
+    with instrument.stage('summary', tables=len(tables)) as info:
+        long = stack_indicators(tables)
+        info['rows'] = len(long)
+        return {'series': series_stats(long), 'gaps': sex_gaps(long), 'gradients': gradients(long)}
+
+
+def _context(row, cols):
+    return ', '.join(str(row[col]) for col in cols if row[col] not in ('', 'T', None))
+
+
+def summary_blocks(stats, titles):
+    #one short text block per indicator, in the order of titles
+    series = stats['series'].groupby('indicator', sort=False)
+    gaps = stats['gaps'].groupby('indicator', sort=False)
+    grads = stats['gradients'].groupby('indicator', sort=False)
+    blocks = []
+
+    for title in titles:
+        lines = ['## ' + title, 'series|latest year|latest|trend/yr|change since']
+        if title in series.groups:
+            for row in series.get_group(title).itertuples(index=False):
+                row = row._asdict()
+                lines.append('|'.join([_context(row, ['sex', 'series', 'level']) or 'all', str(row['latest_year']),
+                                       compact_number(row['latest_value']), compact_number(row['slope']),
+                                       (compact_number(row['change']) + ' (' + str(row['first_year']) + ')') if pd.notna(row['change']) else '']))
+        if title in gaps.groups:
+            for row in gaps.get_group(title).itertuples(index=False):
+                row = row._asdict()
+                lines.append('M-F gap|' + str(row['Year']) + '|' + compact_number(row['gap']) + ' (' + _context(row, ['series', 'level']) + ')')
+        if title in grads.groups:
+            for row in grads.get_group(title).itertuples(index=False):
+                row = row._asdict()
+                lines.append(row['stratifier'] + ' gradient|' + str(row['Year']) + '|' + compact_number(row['gradient']) +
+                             ' (' + row['high_level'] + ' vs ' + row['low_level'] + ', ratio ' + compact_number(row['ratio']) + ')' +
+                             ((' ' + _context(row, ['sex', 'series'])) if _context(row, ['sex', 'series']) else ''))
+        blocks.append((title, '\n'.join(lines)))
+    return blocks
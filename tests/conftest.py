@@ -0,0 +1,16 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+#the modules of the app are at the top of the repository
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+DATA_DIR = Path(__file__).parent.parent/'data'
+
+
+@pytest.fixture(scope='session')
+def hesr2():
+    #the raw rows of the HESR2 workbook, read once
+    return pd.read_excel(DATA_DIR/'HESR2.xlsx')
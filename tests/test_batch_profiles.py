@@ -0,0 +1,40 @@
+import json
+import struct
+import sys
+import zlib
+
+import pandas as pd
+
+import batch_profiles
+import country_profile
+import render
+
+
+def tiny_png():
+    #1x1 white pixel
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(b'\x00\xff\xff\xff')) + chunk(b'IEND', b''))
+
+
+def fake_fetch(rows, on_thread=None):
+    #a few years of data for Albania (ISO3 and ISO2) for every indicator, no network
+    for row in rows:
+        code = 'AL' if row['Indicator.datasource'] == "EUROSTAT" else 'ALB'
+        yield row, pd.DataFrame({'Country Code': [code] * 3, 'Year': [2020, 2021, 2022], 'Value': [1.0, 2.0, 3.0]}), None
+
+
+def test_one_country_without_ai(tmp_path, monkeypatch):
+    monkeypatch.setattr(country_profile, 'fetch_profile_indicators', fake_fetch)
+    monkeypatch.setattr(render, 'render_pngs', lambda specs: [tiny_png() for spec in specs])
+    monkeypatch.setattr(sys, 'argv', ['batch_profiles.py', '--country', 'ALB', '--no-ai', '--workers', '1', '--out', str(tmp_path)])
+
+    batch_profiles.main()
+
+    report = json.loads((tmp_path/'summary.json').read_text())
+    assert [entry['code'] for entry in report['profiles']] == ['ALB']
+    entry = report['profiles'][0]
+    assert entry['status'] == 'ok', entry.get('error')
+    assert entry['with_data'] == entry['indicators'] > 0
+    assert (tmp_path/'ALB.docx').stat().st_size > 0
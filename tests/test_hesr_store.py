@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import hesr_store
+
+
+def latest_groups(raw):
+    #number of series of the raw rows, each with its latest year
+    return len(raw.dropna().groupby(hesr_store.latest_keys(raw.columns)).last())
+
+
+def test_latest_rows_one_per_series(hesr2):
+    part = hesr2[hesr2['indicator_abbr'] == 's1_001']
+    latest = hesr_store.latest_rows(part)
+
+    assert len(latest) == latest_groups(part)
+    #one row per level of the stratifiers, not one per country and sex
+    assert len(latest) > part[['Country Code', 'sex', 'dimension']].drop_duplicates().shape[0]
+
+    full = part.dropna()
+    full = full.assign(Year=full['Year'].astype(int))
+    keys = hesr_store.latest_keys(part.columns)
+    expected = full.groupby(keys)['Year'].max().rename('latest').reset_index()
+    merged = latest.merge(expected, on=keys)
+    assert len(merged) == len(latest)
+    assert (merged['Year'].astype(int) == merged['latest']).all()
+
+
+def test_store_keeps_the_latest_view(hesr2, tmp_path, monkeypatch):
+    monkeypatch.setattr(hesr_store, 'CACHE_DIR', tmp_path)
+    data_filename = Path(__file__).parent.parent/'data/HESR2.xlsx'
+
+    latest = hesr_store.load_latest(data_filename, 's1_001')
+    assert len(latest) == latest_groups(hesr2[hesr2['indicator_abbr'] == 's1_001'])
+    assert hesr_store.load_latest(data_filename, 'no such indicator') is None
+
+
+def test_concurrent_open_builds_once(hesr2, tmp_path, monkeypatch):
+    monkeypatch.setattr(hesr_store, 'CACHE_DIR', tmp_path)
+    builds = []
+    monkeypatch.setattr(hesr_store.pd, 'read_excel', lambda path: builds.append(path) or hesr2)
+    data_filename = Path(__file__).parent.parent/'data/HESR2.xlsx'
+
+    with ThreadPoolExecutor(8) as pool:
+        manifests = list(pool.map(lambda i: hesr_store.open_store(data_filename), range(8)))
+
+    assert len(builds) == 1
+    assert len({manifest['version'] for manifest in manifests}) == 1
+    assert len(hesr_store.load_indicator(data_filename, 's1_001')) == (hesr2['indicator_abbr'] == 's1_001').sum()
@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+
+import prompt
+
+
+def test_missing_values_are_empty_cells():
+    assert prompt.compact_number(np.float32('nan')) == ''
+    assert prompt.compact_number(np.nan) == ''
+    assert prompt.compact_number(None) == ''
+    assert prompt.compact_number(np.float32(12.345)) == '12.3'
+
+
+def test_float32_table_has_no_nan_tokens():
+    pivot_data = pd.DataFrame({2019: [1.5, np.nan], 2020: [np.nan, 2.25]}, index=pd.Index(['F', 'M'], name='sex')).astype('float32')
+    text = prompt.encode_table('title', pivot_data)
+    assert 'nan' not in text
+    assert text.splitlines()[2:] == ['F|1.5|', 'M||2.25']
@@ -0,0 +1,21 @@
+import loaders
+import summary
+
+
+def test_hesr_series_and_gradients(hesr2):
+    part = hesr2[(hesr2['indicator_abbr'] == 's1_001') & (hesr2['Country Code'] == 'AUT')]
+    gdp_df, meta = loaders.parse_hesr_frame(part, 'WHO/HESRI 2')
+    stats = summary.summarize([('s1_001', loaders.normalize_frame(gdp_df))])
+
+    #population and the constant columns do not split the series
+    series = stats['series']
+    assert len(series) > 0
+    assert (series['n'] > 1).all()
+    assert series['slope'].notna().all()
+
+    #one gradient per sex for each stratifier
+    gradients = stats['gradients']
+    assert set(gradients['stratifier']) == {'Education', 'Income'}
+    assert set(gradients['sex']) == {'F', 'M'}
+    assert len(gradients) == 4
+    assert (gradients['high_level'].isin(['High education', 'Income Q5 (highest)'])).all()
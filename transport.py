@@ -0,0 +1,133 @@
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import instrument
+
+#-----------------------------------------------------------------
+# HTTP transport shared by the remote loaders
+#
+# One requests.Session per process: connections are pooled and kept alive
+# per host, responses are requested compressed, every call has a connect
+# and a read timeout, and transient errors are retried with jittered
+# exponential backoff. Per-host counters are available via host_metrics().
+#
+# WELLBEING_HTTP_BASE=http://127.0.0.1:8765 sends every request to a local
+# stand-in instead (http://<base>/<host>/<path>), see benchmarks/replay.py.
+#-----------------------------------------------------------------
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+POOL_SIZE = 10
+RETRY_STATUS = {429, 500, 502, 503, 504}
+MAX_REQUESTS_PER_HOST = 3
+
+BASE_URL = os.environ.get('WELLBEING_HTTP_BASE')
+
+_session = None
+_session_lock = threading.Lock()
+_metrics = {}
+_metrics_lock = threading.Lock()
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+            _session = session
+        return _session
+
+
+def host_limit(url):
+    #semaphore bounding the parallel fetches sent to one host, shared by all sessions of the process
+    host = urlparse(url).netloc
+    with _host_limits_lock:
+        if host not in _host_limits: _host_limits[host] = threading.BoundedSemaphore(MAX_REQUESTS_PER_HOST)
+        return _host_limits[host]
+
+
+def _record(host, **counters):
+    with _metrics_lock:
+        m = _metrics.setdefault(host, {'requests': 0, 'retries': 0, 'errors': 0, 'bytes': 0, 'seconds': 0.0})
+        for key, value in counters.items():
+            m[key] += value
+
+
+def host_metrics():
+    #{host: {'requests', 'retries', 'errors', 'bytes', 'seconds'}}
+    with _metrics_lock:
+        return {host: dict(m) for host, m in _metrics.items()}
+
+
+def set_base_url(base_url):
+    global BASE_URL
+    BASE_URL = base_url
+
+
+def rewrite_url(url):
+    if not BASE_URL: return url
+    parts = urlparse(url)
+    return BASE_URL.rstrip('/') + '/' + parts.netloc + parts.path + ('?' + parts.query if parts.query else '')
+
+
+def _backoff(attempt, retry_after=None):
+    if retry_after is not None:
+        try:
+            return min(BACKOFF_MAX, float(retry_after))
+        except ValueError:
+            pass
+    #"full jitter": a random wait up to the exponential bound
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def get(url, headers=None, timeout=None, retries=MAX_RETRIES):
+    host = urlparse(url).netloc
+    with instrument.stage('fetch', host=host) as info:
+        response = _get(url, headers, timeout, retries)
+        info['bytes'] = len(response.content)
+        info['status'] = response.status_code
+    return response
+
+
+def _get(url, headers, timeout, retries):
+    session = get_session()
+    host = urlparse(url).netloc
+    url = rewrite_url(url)
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+    for attempt in range(retries + 1):
+        start = time.perf_counter()
+        try:
+            response = session.get(url, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            _record(host, requests=1, errors=1, seconds=time.perf_counter() - start)
+            if attempt == retries: raise
+            _record(host, retries=1)
+            time.sleep(_backoff(attempt))
+            continue
+
+        _record(host, requests=1, bytes=len(response.content), seconds=time.perf_counter() - start)
+
+        if (response.status_code in RETRY_STATUS) and (attempt < retries):
+            _record(host, retries=1)
+            time.sleep(_backoff(attempt, response.headers.get('Retry-After')))
+            continue
+
+        if response.status_code >= 400: _record(host, errors=1)
+        response.raise_for_status()
+        return response
@@ -0,0 +1,104 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import loaders
+import reference
+import refresh
+import snapshot
+import transport
+
+#-----------------------------------------------------------------
+# Offline warm-up: snapshots every catalog indicator into data/snapshots/
+#
+#   python warmup.py [--workers 8] [--source EUROSTAT ...] [--keep 3] [--full]
+#
+# Walks data/Indicators.xlsx, fetches each (datasource, Indicator_Code) with
+# bounded parallelism and writes the frames and their dimension metadata as
+# a new snapshot version. main.py and chart.py serve from the CURRENT version.
+# Indicators already in the CURRENT version are revalidated with the
+# validators kept in their metadata (see refresh.py) and only downloaded
+# again when the source changed; --full downloads everything.
+#-----------------------------------------------------------------
+
+def catalog_indicators(sources=None):
+    indicators_df = reference.indicators()
+    pairs = indicators_df[['Indicator.datasource', 'Indicator_Code']].dropna().drop_duplicates()
+    if sources: pairs = pairs[pairs['Indicator.datasource'].isin(sources)]
+    return [(source, str(url_code)) for source, url_code in pairs.itertuples(index=False)]
+
+
+def fetch(source, url_code, full=False):
+    #returns (status, df, meta, seconds); df is None when the source did not change
+    previous = None if full else snapshot.load_indicator_meta(source, url_code)
+    url_a, url_b = loaders.indicator_urls(source, url_code)
+    with transport.host_limit(url_a):
+        start = time.perf_counter()
+        validators = previous.get('validators') if previous is not None else None
+        status, validators, result = refresh.fetch_if_changed(source, url_code, validators)
+    seconds = time.perf_counter() - start
+
+    if (status == 'unchanged') and (previous is not None):
+        meta = dict(previous, validators=validators)
+        return status, None, meta, seconds
+    if result is None:
+        result = loaders.load_indicator(source, url_code)
+    df, meta = result
+    meta['validators'] = validators
+    return 'changed', df, meta, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Snapshot every catalog indicator into a local store')
+    parser.add_argument('--workers', type=int, default=8, help='indicators fetched in parallel')
+    parser.add_argument('--source', action='append', help='only this datasource (can be repeated)')
+    parser.add_argument('--keep', type=int, default=3, help='snapshot versions to keep')
+    parser.add_argument('--full', action='store_true', help='download every indicator, even if unchanged')
+    args = parser.parse_args()
+
+    indicators = catalog_indicators(args.source)
+    snap = snapshot.new_snapshot()
+    print("snapshot", snap['version'], "-", len(indicators), "indicators")
+
+    #a failed fetch keeps the indicator of the current version, if there is one
+    failed = 0
+    unchanged = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(fetch, source, url_code, args.full): (source, url_code) for source, url_code in indicators}
+
+        for future in as_completed(futures):
+            source, url_code = futures[future]
+            try:
+                status, df, meta, seconds = future.result()
+            except Exception as e:
+                failed += 1
+                previous = snapshot.load_indicator(source, url_code)
+                if previous is not None:
+                    snapshot.add_indicator(snap, source, url_code, *previous)
+                    print("  FAILED  %-12s %-30s kept previous version (%s)" % (source, url_code, e))
+                else:
+                    snapshot.add_error(snap, source, url_code, e)
+                    print("  FAILED  %-12s %-30s %s" % (source, url_code, e))
+                continue
+
+            if status == 'unchanged':
+                unchanged += 1
+                snapshot.keep_indicator(snap, source, url_code, meta)
+                print("  same    %-12s %-30s %6.1fs  not modified" % (source, url_code, seconds))
+                continue
+
+            snapshot.add_indicator(snap, source, url_code, df, meta)
+            print("  ok      %-12s %-30s %6.1fs  %s" % (source, url_code, seconds, loaders.memory_report(meta)))
+
+    #indicators not in this run (--source) are carried over from the current version
+    snapshot.carry_over(snap)
+    path = snapshot.commit_snapshot(snap)
+    snapshot.prune(args.keep)
+
+    print("written", path, "-", len(indicators) - failed, "ok (" + str(unchanged), "not modified),", failed, "failed")
+    for host, m in transport.host_metrics().items():
+        print("  %-30s %4d requests %3d retries %10d bytes %7.1fs" % (host, m['requests'], m['retries'], m['bytes'], m['seconds']))
+
+
+if __name__ == '__main__':
+    main()